@@ -0,0 +1,167 @@
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Deque, Dict, Iterator, Optional, TextIO, Tuple
+import chess
+import chess.pgn
+import movegeneration
+from movegeneration import next_move, new_game, uci_score, MAX_DEPTH
+
+# Positions handed out per worker ahead of the results being written,
+# so the input is never read much further than the output
+QUEUE_PER_WORKER = 16
+
+# Default search depth, when there is no node budget
+BATCH_DEPTH = 4
+
+
+def read_positions(f: TextIO, pgn: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    Yield an id and a FEN for every position in `f`, one at a time.
+    Lines are EPD (with an optional `id` operation) or FEN, and blank lines and
+    `#` comments are skipped. A line that doesn't parse is passed on as it is, for
+    analyse_position() to report. From PGN: every position of every game's main line.
+    """
+    if pgn:
+        game_number = 0
+        while True:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                return
+            game_number += 1
+            board = game.board()
+            yield f"{game_number}:0", board.fen()
+            for ply, move in enumerate(game.mainline_moves(), start=1):
+                board.push(move)
+                yield f"{game_number}:{ply}", board.fen()
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        try:
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                yield str(line_number), chess.Board(" ".join(fields[:6])).fen()
+            else:
+                board, operations = chess.Board.from_epd(line)
+                yield str(operations.get("id", line_number)), board.fen()
+        except ValueError:
+            yield str(line_number), line
+
+
+def _init_worker(hash_mb: int):
+    movegeneration.transposition_table.resize(hash_mb)
+
+
+def analyse_position(task: Tuple[str, str, int, Optional[int]]) -> Dict[str, Any]:
+    """
+    Runs in a worker process: search one position from scratch.
+    A FEN that doesn't parse, or isn't a legal position, gets an error instead.
+    """
+    position_id, fen, depth, node_limit = task
+    result: Dict[str, Any] = {"id": position_id, "fen": fen}
+    try:
+        board = chess.Board(fen)
+    except ValueError as error:
+        result.update(error=str(error))
+        return result
+    status = board.status()
+    if status != chess.STATUS_VALID:
+        reasons = [str(flag.name).lower().replace("_", " ") for flag in chess.Status if flag & status]
+        result.update(error="invalid position: " + ", ".join(reasons))
+        return result
+    if board.is_game_over():
+        result.update(bestmove=None, result=board.result(), nodes=0, time=0.0)
+        return result
+    # Forget the last position, so results don't depend on which worker gets which
+    new_game()
+    t0 = time.time()
+    move = next_move(depth, board, debug=False, node_limit=node_limit)
+    elapsed = time.time() - t0
+    kind, value = uci_score(movegeneration.debug_info.get("score", 0)).split()
+    result.update(
+        bestmove=move.uci(),
+        score={kind: int(value)},
+        depth=movegeneration.debug_info.get("depth", 0),
+        nodes=movegeneration.debug_info["nodes"],
+        time=round(elapsed, 3),
+        pv=movegeneration.debug_info.get("pv", []),
+    )
+    return result
+
+
+def analyse(
+    positions: Iterator[Tuple[str, str]],
+    output: TextIO,
+    depth: int = BATCH_DEPTH,
+    node_limit: Optional[int] = None,
+    workers: int = 1,
+    hash_mb: int = 16,
+) -> Tuple[int, float]:
+    """
+    Search every position on a pool of `workers` processes and write a JSON line
+    for each, in input order, as soon as it (and those before it) are done.
+    Returns the number of positions and the time taken.
+    """
+    context = multiprocessing.get_context("spawn")
+    pending: Deque[Any] = collections.deque()
+    count = 0
+    t0 = time.time()
+    with context.Pool(workers, initializer=_init_worker, initargs=(hash_mb,)) as pool:
+
+        def write_next():
+            output.write(json.dumps(pending.popleft().get()) + "\n")
+            output.flush()
+
+        for position_id, fen in positions:
+            pending.append(
+                pool.apply_async(analyse_position, ((position_id, fen, depth, node_limit),))
+            )
+            count += 1
+            if len(pending) >= workers * QUEUE_PER_WORKER:
+                write_next()
+        while pending:
+            write_next()
+    return count, time.time() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search every position of an EPD, FEN or PGN file and write the results as JSON lines"
+    )
+    parser.add_argument("input", help="EPD/FEN file (one position per line) or PGN file, - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL file (default: stdout)")
+    parser.add_argument("--pgn", action="store_true", help="read PGN (default for .pgn files)")
+    parser.add_argument("--depth", type=int, help=f"search depth (default: {BATCH_DEPTH})")
+    parser.add_argument("--nodes", type=int, help="node budget per position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--hash", type=int, default=16, help="transposition table MB per worker")
+    args = parser.parse_args()
+
+    if args.depth is not None:
+        depth = max(1, args.depth)
+    else:
+        depth = MAX_DEPTH if args.nodes is not None else BATCH_DEPTH
+    pgn = args.pgn or args.input.endswith(".pgn")
+    workers = max(1, args.workers)
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        count, elapsed = analyse(
+            read_positions(input_file, pgn), output_file, depth, args.nodes, workers, args.hash
+        )
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    rate = count / max(elapsed, 0.001)
+    print(
+        f"{count} positions in {elapsed:.2f}s: {rate:.1f} positions/s, "
+        f"{rate / workers:.1f} per worker ({workers} workers)",
+        file=sys.stderr,
+    )
@@ -0,0 +1,237 @@
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+import chess
+import communication
+import movegeneration
+from compactboard import CompactBoard
+from evaluate import evaluate_board, move_value, check_end_game, square_value
+from movegeneration import next_move, new_game, set_threads, get_ordered_moves, perft, perft_chess
+
+# A spread of openings, middlegames and endgames
+BENCH_FENS = [
+    chess.STARTING_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "rn1qk2r/pb1nbppp/1p2p3/2ppP3/3P4/P2B1N2/1PP1NPPP/R1BQ1RK1 b kq - 0 1",
+    "r2qkb1r/pppn1pp1/2n1b2p/4p3/3pPP2/3P2P1/PPPBN1BP/R2QK1NR w KQkq - 0 1",
+    "8/5pk1/6p1/8/3R4/6P1/5PK1/8 w - - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+# Depth of the `bench` command
+BENCH_DEPTH = 4
+# Nodes searched by `bench` at BENCH_DEPTH. A change to the search that is meant
+# to change it updates this too; CI fails when it changes without
+BENCH_SIGNATURE = 38576
+
+
+def time_to_depth(depth: int):
+    """
+    Search every bench position to `depth`.
+    Returns the total time and nodes.
+    """
+    total_time = 0.0
+    total_nodes = 0
+    for fen in BENCH_FENS:
+        new_game()
+        t0 = time.time()
+        next_move(depth, chess.Board(fen), debug=False)
+        total_time += time.time() - t0
+        total_nodes += movegeneration.debug_info["nodes"]
+    return total_time, total_nodes
+
+
+def bench(depth: int = BENCH_DEPTH) -> int:
+    """
+    Print the nodes, time and nodes per second to search every bench position.
+    On one thread the total nodes are a signature of the search: they only change
+    when the search itself does, however fast the machine is. Returns the nodes.
+    """
+    total_time = 0.0
+    total_nodes = 0
+    for index, fen in enumerate(BENCH_FENS, start=1):
+        new_game()
+        t0 = time.time()
+        next_move(depth, chess.Board(fen), debug=False)
+        total_time += time.time() - t0
+        nodes = movegeneration.debug_info["nodes"]
+        total_nodes += nodes
+        print(f"Position {index}/{len(BENCH_FENS)}: {nodes} nodes ({fen})")
+    new_game()
+    print(f"Total time (ms) : {int(total_time * 1000)}")
+    print(f"Nodes searched  : {total_nodes}")
+    print(f"Nodes/second    : {int(total_nodes / max(total_time, 0.001))}")
+    return total_nodes
+
+
+def micro(seconds: float):
+    """
+    Print calls per second of the functions the search spends its time in,
+    over the bench positions.
+    """
+    boards = [chess.Board(fen) for fen in BENCH_FENS]
+    compact_boards = [CompactBoard(board) for board in boards]
+    moves = [(board, move, check_end_game(board)) for board in boards for move in board.legal_moves]
+    lookups = [
+        (color, end_game, piece_type, square)
+        for color in chess.COLORS
+        for end_game in (False, True)
+        for piece_type in chess.PIECE_TYPES
+        for square in chess.SQUARES
+    ]
+    benchmarks = [
+        (
+            "square_value",
+            len(lookups),
+            lambda: [square_value(*lookup) for lookup in lookups],
+        ),
+        ("evaluate_board", len(boards), lambda: [evaluate_board(board) for board in boards]),
+        (
+            "get_ordered_moves",
+            len(boards),
+            lambda: [list(get_ordered_moves(board)) for board in compact_boards],
+        ),
+        (
+            "move_value",
+            len(moves),
+            lambda: [move_value(board, move, end_game) for board, move, end_game in moves],
+        ),
+        ("CompactBoard.evaluate", len(boards), lambda: [board.evaluate() for board in compact_boards]),
+        (
+            "next_move (depth 2)",
+            len(boards),
+            lambda: [next_move(2, board, debug=False) for board in boards],
+        ),
+    ]
+    print(f"{'benchmark':<24} {'calls/s':>12} {'us/call':>10}")
+    for name, calls, run in benchmarks:
+        # Repeat for about `seconds`, and keep the fastest run
+        once = timeit.timeit(run, number=1)
+        number = max(1, int(seconds / 5 / max(once, 1e-9)))
+        best = min(timeit.repeat(run, number=number, repeat=5)) / number
+        print(f"{name:<24} {int(calls / best):>12} {best / calls * 1e6:>10.2f}")
+
+
+def perft_speed(depth: int):
+    """
+    Print perft nodes per second over the bench positions, on a CompactBoard
+    and with python-chess: the cost of move generation without any search.
+    """
+    print(f"{'board':<14} {'nodes':>10} {'time':>8} {'nps':>10}")
+    for name, count in (
+        ("CompactBoard", lambda fen: perft(CompactBoard(chess.Board(fen)), depth)),
+        ("python-chess", lambda fen: perft_chess(chess.Board(fen), depth)),
+    ):
+        t0 = time.time()
+        nodes = sum(count(fen) for fen in BENCH_FENS)
+        elapsed = time.time() - t0
+        print(f"{name:<14} {nodes:>10} {elapsed:>8.2f} {int(nodes / elapsed):>10}")
+
+
+def random_game(plies: int, seed: int = 0):
+    """
+    The moves of a random game at least `plies` long.
+    """
+    rng = random.Random(seed)
+    while True:
+        board = chess.Board()
+        while len(board.move_stack) < plies:
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        else:
+            return [move.uci() for move in board.move_stack]
+
+
+def position_latency(plies: int, repeat: int = 50):
+    """
+    Print how long a `position startpos moves ...` command takes `plies` into a game,
+    set up from scratch and when the engine's board is one move behind.
+    """
+    moves = random_game(plies)
+    before = "position startpos moves " + " ".join(moves[:-1])
+    after = "position startpos moves " + " ".join(moves)
+    print(f"{'position':<12} {'us/command':>12}")
+    for name, board_for in (
+        ("full replay", lambda board: chess.Board()),
+        ("incremental", lambda board: board),
+    ):
+        board = chess.Board()
+        elapsed = 0.0
+        for _ in range(repeat):
+            communication.command(0, board, before)
+            board = board_for(board)
+            t0 = time.perf_counter()
+            communication.command(0, board, after)
+            elapsed += time.perf_counter() - t0
+        print(f"{name:<12} {elapsed / repeat * 1e6:>12.1f}")
+
+
+def smp(depth: int, max_threads: int):
+    """
+    Print time-to-depth and nodes per second for 1, 2, 4.. worker processes.
+    """
+    print(f"{'threads':>8} {'time':>8} {'nodes':>10} {'nps':>8} {'speedup':>8}")
+    baseline = None
+    threads = 1
+    while threads <= max_threads:
+        # The first search of a pool pays for starting the workers, so warm it up
+        set_threads(threads)
+        next_move(2, chess.Board(), debug=False)
+        elapsed, nodes = time_to_depth(depth)
+        if baseline is None:
+            baseline = elapsed
+        print(
+            f"{threads:>8} {elapsed:>8.2f} {nodes:>10} {int(nodes / elapsed):>8} "
+            f"{baseline / elapsed:>8.2f}"
+        )
+        threads *= 2
+    set_threads(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    search_parser = subparsers.add_parser(
+        "search", help="nodes, time and nodes per second to search the bench positions"
+    )
+    search_parser.add_argument("--depth", type=int, default=BENCH_DEPTH)
+    search_parser.add_argument(
+        "--check", action="store_true", help=f"fail unless the nodes are {BENCH_SIGNATURE}"
+    )
+    micro_parser = subparsers.add_parser(
+        "micro", help="calls per second of evaluation, move ordering and search"
+    )
+    micro_parser.add_argument("--seconds", type=float, default=1.0, help="per benchmark")
+    perft_parser = subparsers.add_parser(
+        "perft", help="move generation speed, on a CompactBoard and with python-chess"
+    )
+    perft_parser.add_argument("--depth", type=int, default=3)
+    position_parser = subparsers.add_parser(
+        "position", help="latency of the position command late in a game"
+    )
+    position_parser.add_argument("--plies", type=int, default=300)
+    smp_parser = subparsers.add_parser(
+        "smp", help="time-to-depth versus number of worker processes"
+    )
+    smp_parser.add_argument("--depth", type=int, default=4)
+    smp_parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.benchmark == "search":
+        nodes = bench(args.depth)
+        if args.check and nodes != BENCH_SIGNATURE:
+            sys.exit(f"Nodes searched changed: {nodes}, expected {BENCH_SIGNATURE}")
+    if args.benchmark == "micro":
+        micro(args.seconds)
+    if args.benchmark == "perft":
+        perft_speed(args.depth)
+    if args.benchmark == "position":
+        position_latency(args.plies)
+    if args.benchmark == "smp":
+        smp(args.depth, args.threads)
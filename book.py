@@ -0,0 +1,52 @@
+from typing import Optional
+import random
+import chess
+import chess.polyglot
+
+# Polyglot opening books: http://hgm.nubati.net/book_format.html
+# The book is memory-mapped and each lookup is a binary search of the mapped file,
+# so opening it is instant, nothing is loaded into memory, and engine processes
+# on the same host share the pages through the OS page cache.
+
+# Can be switched with the UCI options of the same name
+book_options = {
+    "OwnBook": False,
+    # Always play the most played move instead of picking by weight
+    "BookBestMove": False,
+}
+
+_reader: Optional[chess.polyglot.MemoryMappedReader] = None
+
+
+def open_book(path: str):
+    """
+    Use the book at `path`, or no book for an empty path.
+    """
+    global _reader
+    close_book()
+    if path:
+        _reader = chess.polyglot.open_reader(path)
+
+
+def close_book():
+    global _reader
+    if _reader is not None:
+        _reader.close()
+        _reader = None
+
+
+def book_move(board: chess.Board, rng: Optional[random.Random] = None) -> Optional[chess.Move]:
+    """
+    A move from the book for this position, if the book is on and has one.
+    Moves are picked at random in proportion to their weight, or the heaviest with BookBestMove.
+    """
+    if _reader is None or not book_options["OwnBook"]:
+        return None
+    try:
+        if book_options["BookBestMove"]:
+            entry = _reader.find(board)
+        else:
+            entry = _reader.weighted_choice(board, random=rng)
+    except IndexError:
+        return None
+    return entry.move
@@ -1,20 +1,89 @@
 import sys
 import chess
 import argparse
-from movegeneration import next_move
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import bench
+import book
+import movegeneration
+import tablebase
+from movegeneration import next_move, new_game, MAX_DEPTH
 
+GO_PARAMETERS = ["wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"]
 
-def talk():
+MAX_THREADS = 128
+
+# All times are in milliseconds
+# Time lost to I/O and the GUI on every move
+MOVE_OVERHEAD = 50
+MIN_THINK_TIME = 10
+# Assume the game lasts this many more moves when there is no `movestogo`
+DEFAULT_MOVES_TO_GO = 30
+
+# UCI options handled here rather than by the search
+uci_options: Dict[str, bool] = {"Ponder": False}
+
+# A `go ponder` search: whether it is still running, whether `ponderhit` has
+# been received, the time it may take once it has, and the timer ending it
+_ponder_lock = threading.Lock()
+_ponder: Dict[str, Any] = {}
+
+# The last `position`: its starting FEN and moves, to tell whether the next
+# one continues the same game
+_position: Dict[str, Any] = {}
+
+
+def talk() -> None:
     """
     The main input/output loop.
     This implements a slice of the UCI protocol.
+    `go` searches on another thread so `stop`, `isready` and `quit` are answered
+    while it runs. Any other command waits for the search to finish.
     """
     board = chess.Board()
     depth = get_depth()
+    search: Optional[threading.Thread] = None
 
     while True:
         msg = input()
+        tokens = msg.split()
+
+        if search is not None and search.is_alive():
+            if tokens == ["isready"]:
+                print("readyok", flush=True)
+                continue
+            if tokens == ["ponderhit"]:
+                ponderhit()
+                continue
+            if tokens in (["stop"], ["quit"]):
+                movegeneration.stop()
+            search.join()
+            if tokens == ["stop"]:
+                continue
+
+        if tokens[:1] == ["go"]:
+            movegeneration.clear_stop()
+            search = threading.Thread(target=go, args=(depth, board, msg), daemon=True)
+            search.start()
+        else:
+            command(depth, board, msg)
+
+
+def go(depth: int, board: chess.Board, msg: str):
+    """
+    Run a `go` command on the search thread.
+    An error there would end the thread without a word, so it is reported
+    instead, and a GUI waiting for a move to be searched still gets one.
+    """
+    try:
         command(depth, board, msg)
+    except Exception as error:
+        print(f"info string {type(error).__name__}: {error}", flush=True)
+        if "perft" not in msg.split():
+            move = next(iter(board.legal_moves), None)
+            print(f"bestmove {move or '0000'}", flush=True)
+        movegeneration.clear_stop()
 
 
 def command(depth: int, board: chess.Board, msg: str):
@@ -28,42 +97,53 @@ def command(depth: int, board: chess.Board, msg: str):
         tokens.remove("")
 
     if msg == "quit":
+        # Stop any worker processes
+        movegeneration.set_threads(1)
         sys.exit()
 
     if msg == "uci":
         print("id name Andoma")  # Andrew/Roma -> And/oma
         print("id author Andrew Healey & Roma Parramore")
+        print("option name Hash type spin default 16 min 1 max 1024")
+        print("option name NullMove type check default true")
+        print("option name LMR type check default true")
+        print("option name Ponder type check default false")
+        print("option name OwnBook type check default false")
+        print("option name BookFile type string default <empty>")
+        print("option name BookBestMove type check default false")
+        print("option name SyzygyPath type string default <empty>")
+        print("option name SyzygyProbeLimit type spin default 7 min 0 max 7")
         print("uciok")
         return
 
     if msg == "isready":
-        print("readyok")
+        print("readyok", flush=True)
         return
 
     if msg == "ucinewgame":
+        new_game()
         return
 
-    if msg.startswith("position"):
-        if len(tokens) < 2:
-            return
+    if msg.startswith("setoption"):
+        set_option(tokens)
+        return
 
-        # Set starting position
-        if tokens[1] == "startpos":
-            board.reset()
-            moves_start = 2
-        elif tokens[1] == "fen":
-            fen = " ".join(tokens[2:8])
-            board.set_fen(fen)
-            moves_start = 8
-        else:
-            return
+    if msg.startswith("position"):
+        position = get_position(tokens)
+        if position is not None:
+            set_position(board, *position)
 
-        # Apply moves
-        if len(tokens) <= moves_start or tokens[moves_start] != "moves":
-            return
+    if tokens[:1] == ["perft"] or tokens[:2] == ["go", "perft"]:
+        # Non-standard command: `perft <depth> [python-chess]` or `go perft <depth>`
+        args = tokens[2:] if tokens[0] == "go" else tokens[1:]
+        if args:
+            perft(board, int(args[0]), "python-chess" not in args)
+        return
 
-        for move in tokens[(moves_start+1):]:
-            board.push_uci(move)
+    if tokens[:1] == ["bench"]:
+        # Non-standard command, as in Stockfish: `bench [depth]`
+        bench.bench(int(tokens[1]) if len(tokens) > 1 else bench.BENCH_DEPTH)
+        return
 
     if msg == "d":
         # Non-standard command, but supported by Stockfish and helps debugging
@@ -71,9 +151,255 @@ def command(depth: int, board: chess.Board, msg: str):
         print(board.fen())
 
     if msg[0:2] == "go":
-        _move = next_move(depth, board)
-        print(f"bestmove {_move}")
+        params = get_go_parameters(tokens)
+        time_limit = get_time_limit(params, board.turn)
+        if "ponder" in params:
+            _move = ponder(board, time_limit)
+        elif "infinite" in params:
+            # Search until told to stop, and only then answer
+            _move = next_move(MAX_DEPTH, board)
+            movegeneration.wait_for_stop()
+        else:
+            _move = next_move(
+                get_depth_limit(params, depth, time_limit),
+                board,
+                time_limit=time_limit,
+                node_limit=params.get("nodes"),
+            )
+
+        reply = None
+        if uci_options["Ponder"]:
+            reply = movegeneration.expected_reply(board, _move)
+        # Flushed, as the search may run on its own thread while input() waits
+        if reply is None:
+            print(f"bestmove {_move}", flush=True)
+        else:
+            print(f"bestmove {_move} ponder {reply}", flush=True)
+        # A stop only applies to the search it was sent during
+        movegeneration.clear_stop()
+        return
+
+
+def get_position(tokens: List[str]) -> Optional[Tuple[str, List[str]]]:
+    """
+    The starting FEN and the moves of a `position` command, e.g.
+    `position startpos moves e2e4` -> (chess.STARTING_FEN, ["e2e4"])
+    """
+    if len(tokens) < 2:
+        return None
+
+    # Set starting position
+    if tokens[1] == "startpos":
+        fen = chess.STARTING_FEN
+        moves_start = 2
+    elif tokens[1] == "fen":
+        fen = " ".join(tokens[2:8])
+        moves_start = 8
+    else:
+        return None
+
+    # Apply moves
+    moves = []
+    if len(tokens) > moves_start and tokens[moves_start] == "moves":
+        moves = tokens[(moves_start+1):]
+    return fen, moves
+
+
+def set_position(
+    board: chess.Board, fen: str, moves: List[str], last: Optional[Dict[str, Any]] = None
+):
+    """
+    Set up the position after `moves` from `fen`.
+    GUIs send the whole game before every move, so when the board is already
+    part of the way along the same game only the moves it is missing are made
+    (or the ones it is ahead by taken back), rather than replaying all of them.
+    `last` records the position set up on this board, by default the engine's own.
+    """
+    position = _position if last is None else last
+    played = position.get("moves", [])
+    if (
+        position.get("fen") == fen
+        and played
+        and len(board.move_stack) == len(played)
+        and board.move_stack[-1].uci() == played[-1]
+    ):
+        common = min(len(played), len(moves))
+        if moves[:common] == played[:common]:
+            for _ in range(len(played) - common):
+                board.pop()
+            for move in moves[common:]:
+                board.push_uci(move)
+            position["moves"] = moves
+            return
+
+    # A different game (or a different board): start again from the root
+    position.clear()
+    board.set_fen(fen)
+    for move in moves:
+        board.push_uci(move)
+    position.update(fen=fen, moves=moves)
+
+
+def ponder(board: chess.Board, time_limit: Optional[float]) -> chess.Move:
+    """
+    Search the position after the move we expect the opponent to play, on their time.
+    On `ponderhit` the same search carries on against our clock, with what it
+    has learned so far. On `stop` (they played something else) it answers at once.
+    No bestmove may be sent before either.
+    """
+    with _ponder_lock:
+        _ponder.clear()
+        _ponder.update(searching=True, hit=False, time_limit=time_limit, timer=None)
+    _move = next_move(MAX_DEPTH, board)
+    with _ponder_lock:
+        _ponder["searching"] = False
+        hit = _ponder["hit"]
+    if not hit:
+        movegeneration.wait_for_stop()
+    with _ponder_lock:
+        if _ponder["timer"] is not None:
+            _ponder["timer"].cancel()
+    return _move
+
+
+def ponderhit():
+    """
+    The opponent played the expected move: start our clock on the ponder search.
+    """
+    with _ponder_lock:
+        if not _ponder:
+            return
+        _ponder["hit"] = True
+        if not _ponder["searching"]:
+            # It already finished and is only waiting to answer
+            movegeneration.stop()
+            return
+        time_limit = _ponder["time_limit"]
+        if time_limit is None:
+            # No clock to go by: answer with what has been found
+            movegeneration.stop()
+            return
+        movegeneration.start_clock(time_limit)
+        # Also stops the worker processes, which don't see the new clock
+        timer = threading.Timer(time_limit, movegeneration.stop)
+        timer.daemon = True
+        timer.start()
+        _ponder["timer"] = timer
+
+
+def perft(board: chess.Board, depth: int, compact: bool = True):
+    """
+    Print the move paths after each legal move, their total and how fast they were counted.
+    """
+    t0 = time.time()
+    counts = movegeneration.divide(board, depth, compact)
+    elapsed = max(time.time() - t0, 0.001)
+    for move, nodes in counts:
+        print(f"{move}: {nodes}")
+    total = sum(nodes for _, nodes in counts)
+    print()
+    print(f"Nodes searched: {total}")
+    print(f"Nodes/second: {int(total / elapsed)}", flush=True)
+
+
+def get_go_parameters(tokens: List[str]) -> Dict[str, int]:
+    """
+    Collect the numeric arguments of a `go` command, e.g.
+    `go wtime 60000 btime 60000 winc 1000 binc 1000` -> {"wtime": 60000, ...}
+    `infinite` and `ponder` are recorded with a value of 1.
+    """
+    params = {}
+    for idx, token in enumerate(tokens[1:], start=1):
+        if token == "infinite" or token == "ponder":
+            params[token] = 1
+        elif token in GO_PARAMETERS and idx + 1 < len(tokens):
+            try:
+                params[token] = int(tokens[idx + 1])
+            except ValueError:
+                pass
+    return params
+
+
+def get_time_limit(params: Dict[str, int], turn: chess.Color) -> Optional[float]:
+    """
+    How many seconds should be spent on this move?
+    None means there is no clock: the search goes to a fixed depth,
+    or with `go infinite` until it is stopped.
+    """
+    if "infinite" in params:
+        return None
+    if "movetime" in params:
+        return max(params["movetime"] - MOVE_OVERHEAD, MIN_THINK_TIME) / 1000
+
+    remaining = params.get("wtime" if turn == chess.WHITE else "btime")
+    if remaining is None:
+        return None
+    increment = params.get("winc" if turn == chess.WHITE else "binc", 0)
+    moves_to_go = max(params.get("movestogo", DEFAULT_MOVES_TO_GO), 1)
+
+    # Spread the clock over the remaining moves and spend most of the increment,
+    # but never get close to flagging
+    budget = remaining / moves_to_go + increment * 3 / 4
+    budget = min(budget, remaining - MOVE_OVERHEAD)
+    return max(budget, MIN_THINK_TIME) / 1000
+
+
+def get_depth_limit(params: Dict[str, int], depth: int, time_limit: Optional[float]) -> int:
+    """
+    How deep should the search go?
+    As deep as `go depth` says. Otherwise to the engine's `depth` when nothing
+    else would stop the search, or as deep as the clock or node budget allow.
+    """
+    if "depth" in params:
+        return min(max(params["depth"], 1), MAX_DEPTH)
+    if time_limit is None and "nodes" not in params:
+        return depth
+    return MAX_DEPTH
+
+
+def set_option(tokens: List[str]):
+    """
+    Handle `setoption name <id> [value <x>]`.
+    Unknown options are ignored.
+    """
+    if "name" not in tokens:
         return
+    name_start = tokens.index("name") + 1
+    if "value" in tokens:
+        value_start = tokens.index("value")
+        name = " ".join(tokens[name_start:value_start])
+        value = " ".join(tokens[(value_start+1):])
+    else:
+        name = " ".join(tokens[name_start:])
+        value = ""
+
+    if name.lower() == "hash":
+        movegeneration.transposition_table.resize(min(max(int(value), 1), 1024))
+    if name.lower() == "threads":
+        # Not offered by `uci` until root splitting shows a speedup on several cores,
+        # see `python bench.py smp`
+        movegeneration.set_threads(min(max(int(value), 1), MAX_THREADS))
+    if name.lower() == "bookfile":
+        try:
+            book.open_book("" if value == "<empty>" else value)
+        except OSError as error:
+            print(f"info string cannot open book: {error}", flush=True)
+    if name.lower() == "syzygypath":
+        try:
+            tablebase.open_tablebase("" if value == "<empty>" else value)
+        except OSError as error:
+            print(f"info string cannot open tablebases: {error}", flush=True)
+    if name.lower() == "syzygyprobelimit":
+        tablebase.syzygy_options["SyzygyProbeLimit"] = min(max(int(value), 0), 7)
+    for option in book.book_options:
+        if name.lower() == option.lower():
+            book.book_options[option] = value.lower() == "true"
+    for option in uci_options:
+        if name.lower() == option.lower():
+            uci_options[option] = value.lower() == "true"
+    for option in movegeneration.search_options:
+        if name.lower() == option.lower():
+            movegeneration.search_options[option] = value.lower() == "true"
 
 
 def get_depth() -> int:
@@ -0,0 +1,741 @@
+from typing import List, Optional, Tuple
+import chess
+import chess.polyglot
+from evaluate import piece_value, square_value
+
+# A compact board for the search hot loop.
+# Squares are 0x88 indexes (rank * 16 + file), so a step off the board is caught with `& 0x88`
+# https://www.chessprogramming.org/0x88
+# Pieces are small ints and moves are ints, so making and unmaking a move only
+# pushes a tuple to an undo stack instead of allocating python-chess objects.
+# Material, piece-square score, game phase and the polyglot Zobrist key are
+# kept up to date as moves are made.
+# Standard chess only.
+
+EMPTY = 0
+# A piece is its chess.PieceType, plus BLACK_PIECE for black
+BLACK_PIECE = 8
+WHITE_PAWN = chess.PAWN
+BLACK_PAWN = chess.PAWN | BLACK_PIECE
+WHITE_KING = chess.KING
+BLACK_KING = chess.KING | BLACK_PIECE
+
+# A move is `from_square | to_square << 7 | promotion << 14 | flag << 17`
+NULL_MOVE = 0
+DOUBLE_PUSH = 1
+EN_PASSANT = 2
+CASTLING = 3
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+KNIGHT_OFFSETS = (33, 31, 18, 14, -14, -18, -31, -33)
+KING_OFFSETS = (17, 16, 15, 1, -1, -15, -16, -17)
+BISHOP_OFFSETS = (17, 15, -15, -17)
+ROOK_OFFSETS = (16, 1, -1, -16)
+SLIDER_OFFSETS = {
+    chess.BISHOP: BISHOP_OFFSETS,
+    chess.ROOK: ROOK_OFFSETS,
+    chess.QUEEN: KING_OFFSETS,
+}
+
+# 0x88 index of each chess.Square, and the other way around
+SQUARES_0X88 = [chess.square_rank(square) * 16 + chess.square_file(square) for square in chess.SQUARES]
+SQUARES_64 = [-1] * 128
+for _square in chess.SQUARES:
+    SQUARES_64[SQUARES_0X88[_square]] = _square
+
+
+def _piece_table(values, signed: bool = True) -> List[List[int]]:
+    """
+    Turn per-color, per-square values into a [piece][0x88 square] table,
+    negated for black when `signed`.
+    """
+    table = [[0] * 128 for _ in range(16)]
+    for piece_type in chess.PIECE_TYPES:
+        for color in chess.COLORS:
+            piece = piece_type if color == chess.WHITE else piece_type | BLACK_PIECE
+            sign = -1 if signed and color == chess.BLACK else 1
+            for square in chess.SQUARES:
+                table[piece][SQUARES_0X88[square]] = sign * values(color, piece_type, square)
+    return table
+
+
+# White-relative material plus piece-square value, with kings counted separately per phase
+PIECE_VALUES = _piece_table(
+    lambda color, piece_type, square: 0
+    if piece_type == chess.KING
+    else square_value(color, False, piece_type, square)
+)
+KING_MIDDLE_GAME = _piece_table(
+    lambda color, piece_type, square: square_value(color, False, piece_type, square)
+    if piece_type == chess.KING
+    else 0
+)
+KING_END_GAME = _piece_table(
+    lambda color, piece_type, square: square_value(color, True, piece_type, square)
+    if piece_type == chess.KING
+    else 0
+)
+# Material alone, by piece (either color)
+MATERIAL = [piece_value.get(piece & 7, 0) for piece in range(16)]
+
+_polyglot_random = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST = _piece_table(
+    lambda color, piece_type, square: _polyglot_random[64 * ((piece_type - 1) * 2 + color) + square],
+    signed=False,
+)
+CASTLING_KEYS = [
+    (_polyglot_random[768] if rights & WHITE_KINGSIDE else 0)
+    ^ (_polyglot_random[769] if rights & WHITE_QUEENSIDE else 0)
+    ^ (_polyglot_random[770] if rights & BLACK_KINGSIDE else 0)
+    ^ (_polyglot_random[771] if rights & BLACK_QUEENSIDE else 0)
+    for rights in range(16)
+]
+EN_PASSANT_KEYS = [_polyglot_random[772 + file] for file in range(8)]
+TURN_KEY = _polyglot_random[780]
+
+# Castling rights kept when a move starts or ends on a square
+CASTLING_MASKS = [15] * 128
+CASTLING_MASKS[0x04] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[0x07] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASKS[0x00] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[0x74] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[0x77] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[0x70] = 15 & ~BLACK_QUEENSIDE
+
+# Undo stack entries: the move, the captured piece and the state it can't recompute
+Undo = Tuple[int, int, int, int, int, int, int, int, int, int, int]
+
+
+def encode_move(from_square: int, to_square: int, promotion: int = 0, flag: int = 0) -> int:
+    return from_square | to_square << 7 | promotion << 14 | flag << 17
+
+
+class CompactBoard:
+    """
+    A position plus the history needed to spot repetitions, for the search.
+    Build one from a chess.Board with from_board().
+    """
+
+    __slots__ = (
+        "squares",
+        "turn",
+        "castling",
+        "ep_square",
+        "halfmove_clock",
+        "kings",
+        "pieces",
+        "total",
+        "king_middle_game",
+        "king_end_game",
+        "queens",
+        "minors",
+        "board_key",
+        "keys",
+        "root",
+        "undo",
+    )
+
+    def __init__(self, board: Optional[chess.Board] = None) -> None:
+        """
+        Set up the current position of `board` (without its move history),
+        or the starting position.
+        """
+        if board is None:
+            board = chess.Board()
+        self.squares = [EMPTY] * 128
+        # Indexed by color
+        self.kings = [-1, -1]
+        self.pieces: List[List[int]] = [[], []]
+        # White-relative material and piece-square total for everything but the kings
+        self.total = 0
+        # White-relative king piece-square values for both game phases
+        self.king_middle_game = 0
+        self.king_end_game = 0
+        self.queens = 0
+        self.minors = 0
+        # Zobrist key of the pieces alone
+        self.board_key = 0
+        for square, _piece in board.piece_map().items():
+            piece = _piece.piece_type if _piece.color else _piece.piece_type | BLACK_PIECE
+            self._put(piece, SQUARES_0X88[square])
+
+        self.turn = board.turn
+        rights = board.clean_castling_rights()
+        self.castling = (
+            (WHITE_KINGSIDE if rights & chess.BB_H1 else 0)
+            | (WHITE_QUEENSIDE if rights & chess.BB_A1 else 0)
+            | (BLACK_KINGSIDE if rights & chess.BB_H8 else 0)
+            | (BLACK_QUEENSIDE if rights & chess.BB_A8 else 0)
+        )
+        self.ep_square = -1 if board.ep_square is None else SQUARES_0X88[board.ep_square]
+        self.halfmove_clock = board.halfmove_clock
+        self.undo: List[Undo] = []
+        self.keys = [self.position_key()]
+        # Index in keys of the position the search started from
+        self.root = 0
+
+    @classmethod
+    def from_board(cls, board: chess.Board) -> "CompactBoard":
+        """
+        Replay the game so positions before the current one are known for repetition checks.
+        """
+        compact = cls(board.root())
+        for move in board.move_stack:
+            compact.push(compact.from_chess_move(move))
+        compact.root = len(compact.keys) - 1
+        return compact
+
+    def _put(self, piece: int, square: int):
+        self.squares[square] = piece
+        piece_type = piece & 7
+        color = not piece & BLACK_PIECE
+        self.pieces[color].append(square)
+        self.board_key ^= ZOBRIST[piece][square]
+        if piece_type == chess.KING:
+            self.kings[color] = square
+            self.king_middle_game += KING_MIDDLE_GAME[piece][square]
+            self.king_end_game += KING_END_GAME[piece][square]
+            return
+        self.total += PIECE_VALUES[piece][square]
+        if piece_type == chess.QUEEN:
+            self.queens += 1
+        elif piece_type == chess.KNIGHT or piece_type == chess.BISHOP:
+            self.minors += 1
+
+    def position_key(self) -> int:
+        """
+        Same as chess.polyglot.zobrist_hash().
+        """
+        key = self.board_key ^ CASTLING_KEYS[self.castling]
+        ep_square = self.ep_square
+        if ep_square != -1:
+            # Only if there is a pawn ready to capture en passant
+            if self.turn:
+                pawn, left, right = WHITE_PAWN, ep_square - 17, ep_square - 15
+            else:
+                pawn, left, right = BLACK_PAWN, ep_square + 15, ep_square + 17
+            squares = self.squares
+            if (not left & 0x88 and squares[left] == pawn) or (
+                not right & 0x88 and squares[right] == pawn
+            ):
+                key ^= EN_PASSANT_KEYS[ep_square & 7]
+        if self.turn:
+            key ^= TURN_KEY
+        return key
+
+    def zobrist_key(self) -> int:
+        return self.keys[-1]
+
+    def push(self, move: int):
+        """
+        Make a (pseudo-legal) move.
+        """
+        squares = self.squares
+        from_square = move & 127
+        to_square = (move >> 7) & 127
+        promotion = (move >> 14) & 7
+        flag = move >> 17
+        piece = squares[from_square]
+        captured = squares[to_square]
+        turn = self.turn
+        self.undo.append(
+            (
+                move,
+                captured,
+                self.castling,
+                self.ep_square,
+                self.halfmove_clock,
+                self.total,
+                self.king_middle_game,
+                self.king_end_game,
+                self.queens,
+                self.minors,
+                self.board_key,
+            )
+        )
+
+        if flag == EN_PASSANT:
+            captured_square = to_square - 16 if turn else to_square + 16
+            captured = squares[captured_square]
+            squares[captured_square] = EMPTY
+        else:
+            captured_square = to_square
+        if captured:
+            self.pieces[not turn].remove(captured_square)
+            self.total -= PIECE_VALUES[captured][captured_square]
+            self.board_key ^= ZOBRIST[captured][captured_square]
+            captured_type = captured & 7
+            if captured_type == chess.QUEEN:
+                self.queens -= 1
+            elif captured_type == chess.KNIGHT or captured_type == chess.BISHOP:
+                self.minors -= 1
+
+        own = self.pieces[turn]
+        own[own.index(from_square)] = to_square
+        squares[from_square] = EMPTY
+        piece_type = piece & 7
+        if piece_type == chess.KING:
+            squares[to_square] = piece
+            self.kings[turn] = to_square
+            self.king_middle_game += KING_MIDDLE_GAME[piece][to_square] - KING_MIDDLE_GAME[piece][from_square]
+            self.king_end_game += KING_END_GAME[piece][to_square] - KING_END_GAME[piece][from_square]
+            self.board_key ^= ZOBRIST[piece][from_square] ^ ZOBRIST[piece][to_square]
+            if flag == CASTLING:
+                if to_square > from_square:
+                    rook_from, rook_to = from_square + 3, from_square + 1
+                else:
+                    rook_from, rook_to = from_square - 4, from_square - 1
+                rook = squares[rook_from]
+                squares[rook_from] = EMPTY
+                squares[rook_to] = rook
+                own[own.index(rook_from)] = rook_to
+                self.total += PIECE_VALUES[rook][rook_to] - PIECE_VALUES[rook][rook_from]
+                self.board_key ^= ZOBRIST[rook][rook_from] ^ ZOBRIST[rook][rook_to]
+        else:
+            moved = promotion | (piece & BLACK_PIECE) if promotion else piece
+            squares[to_square] = moved
+            self.total += PIECE_VALUES[moved][to_square] - PIECE_VALUES[piece][from_square]
+            self.board_key ^= ZOBRIST[piece][from_square] ^ ZOBRIST[moved][to_square]
+            if promotion == chess.QUEEN:
+                self.queens += 1
+            elif promotion == chess.KNIGHT or promotion == chess.BISHOP:
+                self.minors += 1
+
+        self.castling &= CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+        if flag == DOUBLE_PUSH:
+            self.ep_square = from_square + 16 if turn else from_square - 16
+        else:
+            self.ep_square = -1
+        if piece_type == chess.PAWN or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.turn = not turn
+        self.keys.append(self.position_key())
+
+    def push_null(self):
+        """
+        Pass the turn.
+        """
+        self.undo.append(
+            (
+                NULL_MOVE,
+                EMPTY,
+                self.castling,
+                self.ep_square,
+                self.halfmove_clock,
+                self.total,
+                self.king_middle_game,
+                self.king_end_game,
+                self.queens,
+                self.minors,
+                self.board_key,
+            )
+        )
+        self.ep_square = -1
+        self.halfmove_clock += 1
+        self.turn = not self.turn
+        self.keys.append(self.position_key())
+
+    def pop(self):
+        """
+        Unmake the last move.
+        """
+        (
+            move,
+            captured,
+            self.castling,
+            self.ep_square,
+            self.halfmove_clock,
+            self.total,
+            self.king_middle_game,
+            self.king_end_game,
+            self.queens,
+            self.minors,
+            self.board_key,
+        ) = self.undo.pop()
+        self.keys.pop()
+        turn = self.turn = not self.turn
+        if move == NULL_MOVE:
+            return
+
+        squares = self.squares
+        from_square = move & 127
+        to_square = (move >> 7) & 127
+        flag = move >> 17
+        piece = squares[to_square]
+        if move >> 14 & 7:
+            piece = chess.PAWN | (piece & BLACK_PIECE)
+        squares[from_square] = piece
+        own = self.pieces[turn]
+        own[own.index(to_square)] = from_square
+
+        if flag == EN_PASSANT:
+            squares[to_square] = EMPTY
+            captured_square = to_square - 16 if turn else to_square + 16
+            squares[captured_square] = BLACK_PAWN if turn else WHITE_PAWN
+            self.pieces[not turn].append(captured_square)
+        else:
+            squares[to_square] = captured
+            if captured:
+                self.pieces[not turn].append(to_square)
+
+        if piece & 7 == chess.KING:
+            self.kings[turn] = from_square
+            if flag == CASTLING:
+                if to_square > from_square:
+                    rook_from, rook_to = from_square + 3, from_square + 1
+                else:
+                    rook_from, rook_to = from_square - 4, from_square - 1
+                squares[rook_from] = squares[rook_to]
+                squares[rook_to] = EMPTY
+                own[own.index(rook_to)] = rook_from
+
+    def is_attacked(self, square: int, by_white: bool) -> bool:
+        """
+        Is `square` attacked by a piece of the given color?
+        """
+        squares = self.squares
+        color = 0 if by_white else BLACK_PIECE
+
+        # Pawns attack diagonally forward, so look diagonally backward for them
+        pawn = chess.PAWN | color
+        if by_white:
+            left, right = square - 17, square - 15
+        else:
+            left, right = square + 15, square + 17
+        if (not left & 0x88 and squares[left] == pawn) or (
+            not right & 0x88 and squares[right] == pawn
+        ):
+            return True
+
+        knight = chess.KNIGHT | color
+        for offset in KNIGHT_OFFSETS:
+            target = square + offset
+            if not target & 0x88 and squares[target] == knight:
+                return True
+
+        king = chess.KING | color
+        for offset in KING_OFFSETS:
+            target = square + offset
+            if not target & 0x88 and squares[target] == king:
+                return True
+
+        bishop = chess.BISHOP | color
+        queen = chess.QUEEN | color
+        for offset in BISHOP_OFFSETS:
+            target = square + offset
+            while not target & 0x88:
+                piece = squares[target]
+                if piece:
+                    if piece == bishop or piece == queen:
+                        return True
+                    break
+                target += offset
+
+        rook = chess.ROOK | color
+        for offset in ROOK_OFFSETS:
+            target = square + offset
+            while not target & 0x88:
+                piece = squares[target]
+                if piece:
+                    if piece == rook or piece == queen:
+                        return True
+                    break
+                target += offset
+
+        return False
+
+    def is_check(self) -> bool:
+        """
+        Is the side to move in check?
+        """
+        return self.is_attacked(self.kings[self.turn], not self.turn)
+
+    def was_legal(self) -> bool:
+        """
+        After push(): did the move leave its own king safe?
+        """
+        return not self.is_attacked(self.kings[not self.turn], self.turn)
+
+    def generate_tactical(self) -> List[int]:
+        """
+        Pseudo-legal captures (including en passant) and promotions.
+        """
+        return self._generate(self.pieces[self.turn], True, False)
+
+    def generate_quiet(self) -> List[int]:
+        """
+        Pseudo-legal moves that are neither captures nor promotions, including castling.
+        """
+        return self._generate(self.pieces[self.turn], False, True)
+
+    def generate_pseudo_legal(self) -> List[int]:
+        return self._generate(self.pieces[self.turn], True, True)
+
+    def generate_legal(self) -> List[int]:
+        moves = []
+        for move in self.generate_pseudo_legal():
+            self.push(move)
+            if self.was_legal():
+                moves.append(move)
+            self.pop()
+        return moves
+
+    def is_pseudo_legal(self, move: int) -> bool:
+        """
+        Could this move (say from the transposition table) be made here?
+        """
+        from_square = move & 127
+        piece = self.squares[from_square]
+        if not piece or bool(piece & BLACK_PIECE) == self.turn:
+            return False
+        return move in self._generate([from_square], True, True)
+
+    def _generate(self, from_squares: List[int], tactical: bool, quiet: bool) -> List[int]:
+        squares = self.squares
+        turn = self.turn
+        enemy = BLACK_PIECE if turn else 0
+        moves: List[int] = []
+        append = moves.append
+
+        for from_square in from_squares:
+            piece = squares[from_square]
+            piece_type = piece & 7
+
+            if piece_type == chess.PAWN:
+                if turn:
+                    forward, start_rank, last_rank = 16, 1, 7
+                else:
+                    forward, start_rank, last_rank = -16, 6, 0
+                target = from_square + forward
+                promotes = target >> 4 == last_rank
+                if squares[target] == EMPTY:
+                    if promotes:
+                        if tactical:
+                            for promotion in (chess.QUEEN, chess.KNIGHT, chess.ROOK, chess.BISHOP):
+                                append(from_square | target << 7 | promotion << 14)
+                    elif quiet:
+                        append(from_square | target << 7)
+                        if from_square >> 4 == start_rank and squares[target + forward] == EMPTY:
+                            append(from_square | (target + forward) << 7 | DOUBLE_PUSH << 17)
+                if tactical:
+                    for target in (from_square + forward - 1, from_square + forward + 1):
+                        if target & 0x88:
+                            continue
+                        victim = squares[target]
+                        if victim and (victim & BLACK_PIECE) == enemy:
+                            if promotes:
+                                for promotion in (chess.QUEEN, chess.KNIGHT, chess.ROOK, chess.BISHOP):
+                                    append(from_square | target << 7 | promotion << 14)
+                            else:
+                                append(from_square | target << 7)
+                        elif target == self.ep_square:
+                            append(from_square | target << 7 | EN_PASSANT << 17)
+
+            elif piece_type == chess.KNIGHT or piece_type == chess.KING:
+                for offset in KNIGHT_OFFSETS if piece_type == chess.KNIGHT else KING_OFFSETS:
+                    target = from_square + offset
+                    if target & 0x88:
+                        continue
+                    victim = squares[target]
+                    if victim == EMPTY:
+                        if quiet:
+                            append(from_square | target << 7)
+                    elif tactical and (victim & BLACK_PIECE) == enemy:
+                        append(from_square | target << 7)
+                if piece_type == chess.KING and quiet:
+                    self._generate_castling(from_square, append)
+
+            else:
+                for offset in SLIDER_OFFSETS[piece_type]:
+                    target = from_square + offset
+                    while not target & 0x88:
+                        victim = squares[target]
+                        if victim == EMPTY:
+                            if quiet:
+                                append(from_square | target << 7)
+                        else:
+                            if tactical and (victim & BLACK_PIECE) == enemy:
+                                append(from_square | target << 7)
+                            break
+                        target += offset
+
+        return moves
+
+    def _generate_castling(self, king: int, append):
+        # The king may not castle out of, through or into check
+        # (into check is left to the legality test after the move)
+        if self.turn:
+            kingside, queenside, home = WHITE_KINGSIDE, WHITE_QUEENSIDE, 0x04
+        else:
+            kingside, queenside, home = BLACK_KINGSIDE, BLACK_QUEENSIDE, 0x74
+        if king != home or not self.castling & (kingside | queenside):
+            return
+        squares = self.squares
+        enemy_white = not self.turn
+        if self.is_attacked(king, enemy_white):
+            return
+        if (
+            self.castling & kingside
+            and squares[king + 1] == EMPTY
+            and squares[king + 2] == EMPTY
+            and not self.is_attacked(king + 1, enemy_white)
+        ):
+            append(king | (king + 2) << 7 | CASTLING << 17)
+        if (
+            self.castling & queenside
+            and squares[king - 1] == EMPTY
+            and squares[king - 2] == EMPTY
+            and squares[king - 3] == EMPTY
+            and not self.is_attacked(king - 1, enemy_white)
+        ):
+            append(king | (king - 2) << 7 | CASTLING << 17)
+
+    def has_legal_move(self) -> bool:
+        for move in self.generate_pseudo_legal():
+            self.push(move)
+            legal = self.was_legal()
+            self.pop()
+            if legal:
+                return True
+        return False
+
+    def is_checkmate(self) -> bool:
+        return self.is_check() and not self.has_legal_move()
+
+    def peek(self) -> int:
+        """
+        The last move made, or NULL_MOVE.
+        """
+        return self.undo[-1][0] if self.undo else NULL_MOVE
+
+    def is_capture(self, move: int) -> bool:
+        return bool(self.squares[(move >> 7) & 127]) or move >> 17 == EN_PASSANT
+
+    def captured_value(self, move: int) -> int:
+        """
+        The material a capture (or promotion) wins before any recapture.
+        """
+        if move >> 17 == EN_PASSANT:
+            gain = MATERIAL[chess.PAWN]
+        else:
+            gain = MATERIAL[self.squares[(move >> 7) & 127]]
+        promotion = (move >> 14) & 7
+        if promotion:
+            gain += MATERIAL[promotion] - MATERIAL[chess.PAWN]
+        return gain
+
+    def mvv_lva(self, move: int) -> int:
+        """
+        Most Valuable Victim - Least Valuable Aggressor.
+        Order captures (and promotions) by what is won first and by what risks it second.
+        https://www.chessprogramming.org/MVV-LVA
+        """
+        return self.captured_value(move) * 100 - MATERIAL[self.squares[move & 127]] // 100
+
+    def piece_square_gain(self, move: int, end_game: bool) -> int:
+        """
+        How much does a quiet move improve the position of the moving piece,
+        for the side making it?
+        """
+        piece = self.squares[move & 127]
+        if piece & 7 == chess.KING:
+            table = KING_END_GAME[piece] if end_game else KING_MIDDLE_GAME[piece]
+        else:
+            table = PIECE_VALUES[piece]
+        gain = table[(move >> 7) & 127] - table[move & 127]
+        return gain if self.turn else -gain
+
+    def is_repetition(self) -> bool:
+        """
+        Should the search score this position as a draw by repetition?
+        Only positions since the last capture or pawn move can repeat it. Once is enough when the earlier position is inside the search (the side that
+        repeated could have played differently), but a position from before the root
+        must have been seen twice already, so the repeat could be claimed.
+        """
+        keys = self.keys
+        key = keys[-1]
+        count = 0
+        oldest = max(len(keys) - 1 - self.halfmove_clock, 0)
+        for index in range(len(keys) - 3, oldest - 1, -2):
+            if keys[index] == key:
+                if index >= self.root:
+                    return True
+                count += 1
+                if count == 2:
+                    return True
+        return False
+
+    def is_insufficient_material(self) -> bool:
+        """
+        Only kings, or kings and a single knight or bishop, are left.
+        """
+        pieces = len(self.pieces[0]) + len(self.pieces[1])
+        return pieces == 2 or (pieces == 3 and self.minors == 1)
+
+    def is_end_game(self) -> bool:
+        """
+        Same as check_end_game(), from the maintained piece counts.
+        """
+        return self.queens == 0 or (self.queens == 2 and self.minors <= 1)
+
+    def evaluate(self) -> int:
+        """
+        Same as evaluate_board().
+        """
+        if self.is_end_game():
+            return self.total + self.king_end_game
+        return self.total + self.king_middle_game
+
+    def to_board(self) -> chess.Board:
+        """
+        The current position (without its history) as a chess.Board.
+        """
+        board = chess.Board(None)
+        for color in chess.COLORS:
+            for square in self.pieces[color]:
+                board.set_piece_at(SQUARES_64[square], chess.Piece(self.squares[square] & 7, color))
+        board.turn = self.turn
+        board.castling_rights = (
+            (chess.BB_H1 if self.castling & WHITE_KINGSIDE else 0)
+            | (chess.BB_A1 if self.castling & WHITE_QUEENSIDE else 0)
+            | (chess.BB_H8 if self.castling & BLACK_KINGSIDE else 0)
+            | (chess.BB_A8 if self.castling & BLACK_QUEENSIDE else 0)
+        )
+        board.ep_square = None if self.ep_square == -1 else SQUARES_64[self.ep_square]
+        board.halfmove_clock = self.halfmove_clock
+        return board
+
+    def from_chess_move(self, move: chess.Move) -> int:
+        from_square = SQUARES_0X88[move.from_square]
+        to_square = SQUARES_0X88[move.to_square]
+        piece_type = self.squares[from_square] & 7
+        flag = 0
+        if piece_type == chess.PAWN:
+            if abs(to_square - from_square) == 32:
+                flag = DOUBLE_PUSH
+            elif to_square == self.ep_square:
+                flag = EN_PASSANT
+        elif piece_type == chess.KING and abs(to_square - from_square) == 2:
+            flag = CASTLING
+        return encode_move(from_square, to_square, move.promotion or 0, flag)
+
+    def parse_uci(self, uci: str) -> int:
+        return self.from_chess_move(chess.Move.from_uci(uci))
+
+
+def to_chess_move(move: int) -> chess.Move:
+    promotion = (move >> 14) & 7
+    return chess.Move(
+        SQUARES_64[move & 127], SQUARES_64[(move >> 7) & 127], promotion or None
+    )
+
+
+def move_uci(move: int) -> str:
+    return to_chess_move(move).uci()
@@ -1,3 +1,4 @@
+from typing import List
 import chess
 
 # this module implement's Tomasz Michniewski's Simplified Evaluation Function
@@ -111,9 +112,12 @@ def move_value(board: chess.Board, move: chess.Move, endgame: bool) -> float:
 
     _piece = board.piece_at(move.from_square)
     if _piece:
-        _from_value = evaluate_piece(_piece, move.from_square, endgame)
-        _to_value = evaluate_piece(_piece, move.to_square, endgame)
-        position_change = _to_value - _from_value
+        # Material is the same on both squares, so only the piece-square values differ
+        offset = square_index(_piece.color, endgame, _piece.piece_type, 0)
+        position_change = (
+            PIECE_SQUARE_TABLE[offset + move.to_square]
+            - PIECE_SQUARE_TABLE[offset + move.from_square]
+        )
     else:
         raise Exception(f"A piece was expected at {move.from_square}")
 
@@ -144,33 +148,16 @@ def evaluate_capture(board: chess.Board, move: chess.Move) -> float:
 
 
 def evaluate_piece(piece: chess.Piece, square: chess.Square, end_game: bool) -> int:
-    piece_type = piece.piece_type
-    mapping = []
-    if piece_type == chess.PAWN:
-        mapping = pawnEvalWhite if piece.color == chess.WHITE else pawnEvalBlack
-    if piece_type == chess.KNIGHT:
-        mapping = knightEval
-    if piece_type == chess.BISHOP:
-        mapping = bishopEvalWhite if piece.color == chess.WHITE else bishopEvalBlack
-    if piece_type == chess.ROOK:
-        mapping = rookEvalWhite if piece.color == chess.WHITE else rookEvalBlack
-    if piece_type == chess.QUEEN:
-        mapping = queenEval
-    if piece_type == chess.KING:
-        # use end game piece-square tables if neither side has a queen
-        if end_game:
-            mapping = (
-                kingEvalEndGameWhite
-                if piece.color == chess.WHITE
-                else kingEvalEndGameBlack
-            )
-        else:
-            mapping = kingEvalWhite if piece.color == chess.WHITE else kingEvalBlack
-
-    return mapping[square]
+    """
+    The piece-square value alone, without the piece's material.
+    """
+    return (
+        square_value(piece.color, end_game, piece.piece_type, square)
+        - piece_value[piece.piece_type]
+    )
 
 
-def evaluate_board(board: chess.Board) -> float:
+def evaluate_board(board: chess.Board) -> int:
     """
     Evaluates the full board and determines which player is in a most favorable position.
     The sign indicates the side:
@@ -180,14 +167,20 @@ def evaluate_board(board: chess.Board) -> float:
     """
     total = 0
     end_game = check_end_game(board)
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if not piece:
-            continue
-
-        value = piece_value[piece.piece_type] + evaluate_piece(piece, square, end_game)
-        total += value if piece.color == chess.WHITE else -value
+    table = PIECE_SQUARE_TABLE
+    masks = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+
+    # Walk the set bits of each piece bitboard rather than all 64 squares
+    for color in chess.COLORS:
+        occupied = board.occupied_co[color]
+        color_total = 0
+        # Pawns onwards: the tables of one color and phase follow each other
+        offset = square_index(color, end_game, chess.PAWN, 0)
+        for mask in masks:
+            for square in chess.scan_forward(mask & occupied):
+                color_total += table[offset + square]
+            offset += 64
+        total += color_total if color == chess.WHITE else -color_total
 
     return total
 
@@ -199,19 +192,64 @@ def check_end_game(board: chess.Board) -> bool:
     - Both sides have no queens or
     - Every side which has a queen has additionally no other pieces or one minorpiece maximum.
     """
-    queens = 0
-    minors = 0
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece and piece.piece_type == chess.QUEEN:
-            queens += 1
-        if piece and (
-            piece.piece_type == chess.BISHOP or piece.piece_type == chess.KNIGHT
-        ):
-            minors += 1
+    queens = chess.popcount(board.queens)
+    minors = chess.popcount(board.knights | board.bishops)
 
     if queens == 0 or (queens == 2 and minors <= 1):
         return True
 
     return False
+
+
+def square_index(
+    color: chess.Color, end_game: bool, piece_type: chess.PieceType, square: chess.Square
+) -> int:
+    """
+    Where a piece on a square is in PIECE_SQUARE_TABLE.
+    The squares of one piece type are consecutive, so callers looking up many
+    squares can add them to the index of square 0.
+    """
+    return ((color * 2 + end_game) * 7 + piece_type) * 64 + square
+
+
+def square_value(
+    color: chess.Color, end_game: bool, piece_type: chess.PieceType, square: chess.Square
+) -> int:
+    """
+    Material plus piece-square value of a piece, from its own side's point of view.
+    """
+    return PIECE_SQUARE_TABLE[square_index(color, end_game, piece_type, square)]
+
+
+def _piece_square(color: chess.Color, end_game: bool, piece_type: chess.PieceType) -> List[int]:
+    mapping = [0] * 64
+    if piece_type == chess.PAWN:
+        mapping = pawnEvalWhite if color == chess.WHITE else pawnEvalBlack
+    if piece_type == chess.KNIGHT:
+        mapping = knightEval
+    if piece_type == chess.BISHOP:
+        mapping = bishopEvalWhite if color == chess.WHITE else bishopEvalBlack
+    if piece_type == chess.ROOK:
+        mapping = rookEvalWhite if color == chess.WHITE else rookEvalBlack
+    if piece_type == chess.QUEEN:
+        mapping = queenEval
+    if piece_type == chess.KING:
+        # use end game piece-square tables if neither side has a queen
+        if end_game:
+            mapping = kingEvalEndGameWhite if color == chess.WHITE else kingEvalEndGameBlack
+        else:
+            mapping = kingEvalWhite if color == chess.WHITE else kingEvalBlack
+    return [piece_value.get(piece_type, 0) + value for value in mapping]
+
+
+# Material plus piece-square value of every piece on every square, indexed
+# [color][end_game][piece_type][square] (see square_index()) in one flat list.
+# Piece type 0 is unused, and only kings differ between the phases.
+# A list rather than array("h"): indexing an array builds a new int every time
+PIECE_SQUARE_TABLE = [
+    value
+    for color in (chess.BLACK, chess.WHITE)
+    for end_game in (False, True)
+    for piece_type in range(7)
+    for value in _piece_square(color, end_game, piece_type)
+]
@@ -1,3 +1,4 @@
 from communication import talk
 
-talk()
+if __name__ == "__main__":
+    talk()
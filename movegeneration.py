@@ -1,144 +1,1050 @@
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Sequence, Tuple
 import chess
+import multiprocessing
+import multiprocessing.pool
 import sys
+import threading
 import time
-from evaluate import evaluate_board, move_value, check_end_game
+from book import book_move
+from compactboard import CompactBoard, MATERIAL, NULL_MOVE, to_chess_move, move_uci
+from tablebase import (
+    TB_WIN_SCORE,
+    open_tablebase,
+    piece_limit,
+    probe_wdl,
+    root_moves,
+    syzygy_options,
+    wdl_score,
+)
+from transposition import (
+    TranspositionTable,
+    EXACT,
+    LOWERBOUND,
+    UPPERBOUND,
+)
 
 debug_info: Dict[str, Any] = {}
 
 
 MATE_SCORE     = 1000000000
 MATE_THRESHOLD =  999000000
+INFINITY       = MATE_SCORE + 1
 
+# Deepest iteration when searching against the clock
+MAX_DEPTH = 64
 
-def next_move(depth: int, board: chess.Board, debug=True) -> chess.Move:
+# Persists across searches within a game, see new_game()
+transposition_table = TranspositionTable()
+
+# Two quiet moves per ply that recently caused a beta cutoff
+# https://www.chessprogramming.org/Killer_Heuristic
+KILLER_SLOTS = 2
+killer_moves: List[List[int]] = [[] for _ in range(MAX_DEPTH + 1)]
+
+# How often a quiet move caused a beta cutoff, weighted by depth.
+# Indexed [color][move & HISTORY_MASK], i.e. by the 0x88 from and to squares of the move
+# https://www.chessprogramming.org/History_Heuristic
+HISTORY_MASK = 0x3FFF
+history: List[List[int]] = [[0] * (HISTORY_MASK + 1), [0] * (HISTORY_MASK + 1)]
+
+# The principal variation (expected line of play) found at each ply, see negamax()
+# https://www.chessprogramming.org/Triangular_PV-Table
+pv_table: List[List[int]] = [[] for _ in range(MAX_DEPTH + 2)]
+
+# Seconds between progress reports during a long iteration
+INFO_INTERVAL = 1.0
+
+# Delta pruning: skip captures that can't raise the score to alpha even with this bonus
+DELTA_MARGIN = 200
+
+# Null-move pruning: how much shallower the search after passing is
+NULL_MOVE_REDUCTION = 2
+
+# Late move reductions: quiet moves after this many are searched a ply shallower, at this depth or more
+LMR_MOVES = 3
+LMR_DEPTH = 3
+
+# Aspiration windows: each iteration first searches this far either side of the last score.
+# A score outside the window widens that side by ASPIRATION_GROWTH times, until past the limit
+ASPIRATION_WINDOW = 50
+ASPIRATION_GROWTH = 2
+ASPIRATION_LIMIT = 1000
+
+# Can be switched with the UCI options of the same name
+search_options: Dict[str, bool] = {
+    "NullMove": True,
+    "LMR": True,
+}
+
+# Absolute time (per time.time()) at which a running iteration is abandoned
+_deadline: Optional[float] = None
+# Nodes after which a running iteration is abandoned
+_node_limit: Optional[int] = None
+# When the clock of the running search started and how many seconds it may take
+_clock: Optional[Tuple[float, float]] = None
+# Set to abandon a running search early, see stop()
+_stop_event: Any = threading.Event()
+# The best root move and score of the iteration in progress, once one is known
+_iteration_best: Optional[Tuple[int, int]] = None
+# When the running search started, and when it next reports its progress (if it does)
+_search_start = 0.0
+_next_info: Optional[float] = None
+
+# Worker processes that share the root moves of a search, see set_threads()
+_pool: Optional[multiprocessing.pool.Pool] = None
+_threads = 1
+# Best root score so far, shared with the workers so they can cut off against it
+_shared_alpha: Any = None
+# Nodes the workers have searched of a node budget they share
+_shared_nodes: Any = None
+# In a worker searching to a node budget: _shared_nodes, to count its nodes in
+_node_counter: Any = None
+# Tell workers when a new game or search has started
+_game_id = 0
+_search_id = 0
+# The position being searched, as a starting FEN and the moves played from it
+_root_game: Tuple[str, List[str]] = (chess.STARTING_FEN, [])
+# A worker's copy of the position being searched, keyed by search id
+_worker_board: Optional[Tuple[int, CompactBoard]] = None
+# Positions with this many pieces or fewer are looked up in the endgame tablebases
+_tb_pieces = 0
+# When the tablebases say the root is drawn: the root moves that keep the draw
+_root_filter: Optional[List[int]] = None
+
+
+class SearchTimeout(Exception):
+    """
+    Raised from inside the search when the time budget has been spent,
+    or when it has been asked to stop.
+    """
+
+
+def new_game():
+    """
+    Forget everything learned about the previous game.
+    """
+    global _game_id
+    # Workers keep their own tables and clear them when they see a new game id
+    _game_id += 1
+    transposition_table.clear()
+    for killers in killer_moves:
+        killers.clear()
+    for table in history:
+        table[:] = [0] * (HISTORY_MASK + 1)
+
+
+def set_threads(threads: int):
+    """
+    Search with this many processes. With more than one, the root moves
+    after the first are shared out between a pool of worker processes.
+    """
+    global _pool, _threads, _shared_alpha, _shared_nodes, _stop_event
+    if threads == _threads:
+        return
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+        _stop_event = threading.Event()
+    _threads = threads
+    if threads > 1:
+        # Spawn (rather than fork) so it's safe to start from any thread on any platform
+        context = multiprocessing.get_context("spawn")
+        _shared_alpha = context.Value("q", -INFINITY)
+        _shared_nodes = context.Value("q", 0)
+        # Workers must see a stop too
+        _stop_event = context.Event()
+        _pool = context.Pool(
+            threads, initializer=_init_worker, initargs=(_shared_alpha, _shared_nodes, _stop_event)
+        )
+
+
+def _init_worker(shared_alpha: Any, shared_nodes: Any, stop_event: Any):
+    global _shared_alpha, _shared_nodes, _stop_event
+    _shared_alpha = shared_alpha
+    _shared_nodes = shared_nodes
+    _stop_event = stop_event
+
+
+def set_stop_event(event: Any):
+    """
+    Stop searches when `event` (anything with an is_set() method) is set,
+    e.g. a flag shared with another process.
+    """
+    global _stop_event
+    _stop_event = event
+
+
+def stop():
+    """
+    Ask a running search (from another thread) to finish as soon as it can.
+    It still returns the best move found so far.
+    """
+    _stop_event.set()
+
+
+def clear_stop():
+    """
+    Allow the next search to run. Call before starting it, so a stop sent
+    right after is never lost.
+    """
+    _stop_event.clear()
+
+
+def wait_for_stop():
+    _stop_event.wait()
+
+
+def start_clock(time_limit: float):
+    """
+    Put a running search without a time limit (such as a ponder search)
+    on the clock, from now.
+    """
+    global _clock, _deadline
+    now = time.time()
+    _clock = (now, time_limit)
+    # Not before the first iteration is complete
+    if _deadline is not None:
+        _deadline = now + time_limit
+
+
+def expected_reply(board: chess.Board, move: chess.Move) -> Optional[chess.Move]:
+    """
+    The reply to `move` the last search expects: the next move of its principal
+    variation, or failing that the transposition table's best move.
+    """
+    pv = debug_info.get("pv", [])
+    if len(pv) > 1 and pv[0] == move.uci():
+        return chess.Move.from_uci(pv[1])
+    compact = CompactBoard.from_board(board)
+    compact.push(compact.from_chess_move(move))
+    entry = transposition_table.probe(compact.zobrist_key())
+    if entry is None or entry.move is None:
+        return None
+    if not compact.is_pseudo_legal(entry.move) or not is_legal(compact, entry.move):
+        return None
+    return to_chess_move(entry.move)
+
+
+def age_move_ordering():
+    """
+    Between searches: the game has moved on, so killers are forgotten and the
+    history scores of earlier searches count for less than what comes next.
+    """
+    for killers in killer_moves:
+        killers.clear()
+    for table in history:
+        table[:] = [score // 8 for score in table]
+
+
+def record_cutoff(board: CompactBoard, move: int, depth: int, ply: int):
+    """
+    A quiet move caused a beta cutoff: try it early in sibling nodes and elsewhere.
+    """
+    if (move >> 14) & 7 or board.is_capture(move):
+        return
+    killers = killer_moves[ply]
+    if move not in killers:
+        killers.insert(0, move)
+        del killers[KILLER_SLOTS:]
+    history[board.turn][move & HISTORY_MASK] += depth * depth
+
+
+def next_move(
+    depth: int,
+    board: chess.Board,
+    debug=True,
+    time_limit: Optional[float] = None,
+    node_limit: Optional[int] = None,
+) -> chess.Move:
     """
     What is the next best move?
+    Straight from the opening book, when it has one.
+    Otherwise iterative deepening: search to depth 1, 2, 3.. up to `depth`.
+    With a `time_limit` (in seconds) the search stops once the budget is spent and the
+    best move found so far is played. The same goes for a `node_limit`, and when
+    stop() is called.
     """
+    global _deadline, _clock, _search_id, _root_game, _iteration_best
+    global _search_start, _next_info, _tb_pieces, _root_filter, _node_limit
     debug_info.clear()
     debug_info["nodes"] = 0
-    t0 = time.time()
+    debug_info["seldepth"] = 0
+    debug_info["tt_hits"] = 0
+    debug_info["tt_misses"] = 0
+    debug_info["tb_hits"] = 0
+
+    opening_move = book_move(board)
+    if opening_move is not None:
+        debug_info["book"] = True
+        debug_info["pv"] = [opening_move.uci()]
+        if debug:
+            print(f"info string book move {opening_move}", flush=True)
+        return opening_move
+
+    _tb_pieces = piece_limit()
+    tablebase_moves = root_moves(board)
+    if tablebase_moves is not None and tablebase_moves[0] != 0:
+        # A won or lost ending: play the move that makes progress fastest, or holds out longest
+        wdl, moves = tablebase_moves
+        debug_info["tb_hits"] = 1
+        debug_info["score"] = wdl_score(wdl, 1)
+        debug_info["pv"] = [moves[0].uci()]
+        if debug:
+            print(f"info string tablebase move {moves[0]}", flush=True)
+        return moves[0]
 
-    move = minimax_root(depth, board)
+    transposition_table.new_search()
+    age_move_ordering()
+    _search_id += 1
+    t0 = _search_start = time.time()
+    _next_info = t0 + INFO_INTERVAL if debug else None
 
+    _root_game = (board.root().fen(), [move.uci() for move in board.move_stack])
+    # Search on a compact board that evaluates itself incrementally as moves are made
+    compact = CompactBoard.from_board(board)
+    if tablebase_moves is not None:
+        # A drawn ending: let the search choose between the moves that keep the draw
+        _root_filter = [compact.from_chess_move(drawing_move) for drawing_move in tablebase_moves[1]]
+
+    # The first iteration always completes so there is a move to play
+    _deadline = None
+    _clock = (t0, time_limit) if time_limit is not None else None
+    current_depth = 1
+    move, score = negamax_root(1, compact)
+    pv = list(pv_table[0])
+    debug_info["depth"] = 1
+    iteration_nodes = [debug_info["nodes"]]
+    if debug:
+        print_info(1, score, pv)
+
+    # Later iterations may be cut short by the clock, the node budget or by stop()
+    clock = _clock
+    _deadline = clock[0] + clock[1] if clock is not None else float("inf")
+    _node_limit = node_limit
+    try:
+        for current_depth in range(2, depth + 1):
+            if abs(score) > MATE_THRESHOLD:
+                # A forced mate (for either side) won't change with more depth
+                break
+            # The next iteration will take several times longer than the last,
+            # so don't start it if it can't finish
+            clock = _clock
+            if clock is not None and time.time() - clock[0] > clock[1] / 2:
+                break
+            if _stop_event.is_set():
+                break
+            if node_limit is not None and debug_info["nodes"] >= node_limit:
+                break
+            move, score = aspiration_search(current_depth, compact, move, score)
+            pv = list(pv_table[0])
+            debug_info["depth"] = current_depth
+            iteration_nodes.append(debug_info["nodes"] - sum(iteration_nodes))
+            # Effective branching factor: how many times more nodes each extra ply costs
+            debug_info["ebf"] = round(iteration_nodes[-1] / max(iteration_nodes[-2], 1), 2)
+            if debug:
+                print_info(current_depth, score, pv)
+    except SearchTimeout:
+        # Any move that raised the root alpha in the unfinished iteration
+        # really is better than the moves searched before it
+        if _iteration_best is not None:
+            move, score = _iteration_best
+            pv = list(pv_table[0])
+            if debug:
+                print_info(current_depth, score, pv)
+    finally:
+        _deadline = None
+        _node_limit = None
+        _clock = None
+        _iteration_best = None
+        _next_info = None
+        _root_filter = None
+
+    debug_info["score"] = score
+    debug_info["pv"] = [move_uci(pv_move) for pv_move in pv]
     debug_info["time"] = time.time() - t0
-    if debug == True:
-        print(f"info {debug_info}")
-    return move
+    if debug:
+        print_stats()
+    return to_chess_move(move)
 
 
-def get_ordered_moves(board: chess.Board) -> List[chess.Move]:
+def uci_score(score: int) -> str:
     """
-    Get legal moves.
-    Attempt to sort moves by best to worst.
-    Use piece values (and positional gains/losses) to weight captures.
+    `cp <centipawns>`, or `mate <moves>` (negative when getting mated).
     """
-    end_game = check_end_game(board)
+    if score > MATE_THRESHOLD:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score < -MATE_THRESHOLD:
+        return f"mate {-((MATE_SCORE + score + 1) // 2)}"
+    return f"cp {score}"
 
-    def orderer(move):
-        return move_value(board, move, end_game)
 
-    in_order = sorted(
-        board.legal_moves, key=orderer, reverse=(board.turn == chess.WHITE)
+def print_stats():
+    """
+    Report the search's counters that UCI has no `info` field for, as one `info string` line.
+    """
+    stats = {
+        "tt_hits": debug_info["tt_hits"],
+        "tt_misses": debug_info["tt_misses"],
+        "null_move_cutoffs": debug_info.get("null_move_cutoffs", 0),
+        "aspiration_researches": debug_info.get("aspiration_researches", 0),
+    }
+    if "ebf" in debug_info:
+        stats["ebf"] = debug_info["ebf"]
+    print("info string " + " ".join(f"{name} {value}" for name, value in stats.items()), flush=True)
+
+
+def print_info(depth: int, score: Optional[int] = None, pv: Sequence[int] = ()):
+    """
+    Report on the running search with a UCI `info` line.
+    Without a score this is a progress report from the middle of an iteration.
+    """
+    elapsed = max(time.time() - _search_start, 0.001)
+    nodes = debug_info["nodes"]
+    line = f"info depth {depth} seldepth {max(debug_info['seldepth'], depth)}"
+    if score is not None:
+        line += f" score {uci_score(score)}"
+    line += (
+        f" nodes {nodes} nps {int(nodes / elapsed)} time {int(elapsed * 1000)}"
+        f" hashfull {transposition_table.hashfull()}"
     )
-    return list(in_order)
+    if debug_info.get("tb_hits"):
+        line += f" tbhits {debug_info['tb_hits']}"
+    if pv:
+        line += " pv " + " ".join(move_uci(move) for move in pv)
+    # Flushed, as the search may run on its own thread while input() waits
+    print(line, flush=True)
 
 
-def minimax_root(depth: int, board: chess.Board) -> chess.Move:
+def get_ordered_moves(
+    board: CompactBoard,
+    hash_move: int = NULL_MOVE,
+    killers: Sequence[int] = (),
+    history: Optional[List[int]] = None,
+) -> Iterator[int]:
+    """
+    Generate pseudo-legal moves, best first, in stages:
+    - the move remembered by the transposition table
+    - captures and queen promotions, most valuable victim first
+    - killer moves (quiet moves that caused a cutoff in a sibling node)
+    - other quiet moves, by history score and then piece-square gain
+    - captures that look like they lose material, and under-promotions
+    Each stage is only generated once the previous one is used up, so a cutoff
+    on an early move doesn't pay for scoring the rest.
+    Moves that leave the king in check are only found out by making them: see CompactBoard.was_legal().
+    """
+    if hash_move != NULL_MOVE and board.is_pseudo_legal(hash_move):
+        yield hash_move
+    else:
+        hash_move = NULL_MOVE
+
+    captures, losing_captures = get_tactical_moves(board)
+    for move in captures:
+        if move != hash_move:
+            yield move
+
+    tried = [hash_move]
+    for move in killers:
+        if (
+            move not in tried
+            and not (move >> 14) & 7
+            and not board.is_capture(move)
+            and board.is_pseudo_legal(move)
+        ):
+            tried.append(move)
+            yield move
+
+    end_game = board.is_end_game()
+    quiets = [move for move in board.generate_quiet() if move not in tried]
+    if history is None:
+        quiets.sort(key=lambda move: board.piece_square_gain(move, end_game), reverse=True)
+    else:
+        scores = history
+        quiets.sort(
+            key=lambda move: (
+                scores[move & HISTORY_MASK],
+                board.piece_square_gain(move, end_game),
+            ),
+            reverse=True,
+        )
+    yield from quiets
+
+    for move in losing_captures:
+        if move != hash_move:
+            yield move
+
+
+def count_node():
+    """
+    Count a searched node and give up on the search once the time or node budget
+    is spent or it has been asked to stop.
+    """
+    global _next_info
+    nodes = debug_info["nodes"] = debug_info["nodes"] + 1
+    if nodes % 256 == 0 and (_deadline is not None or _next_info is not None):
+        now = time.time()
+        if _node_counter is not None:
+            # A worker: the node budget is spent by all of them together
+            with _node_counter.get_lock():
+                _node_counter.value += 256
+                nodes = _node_counter.value
+        if _deadline is not None and (
+            now > _deadline
+            or _stop_event.is_set()
+            or (_node_limit is not None and nodes >= _node_limit)
+        ):
+            raise SearchTimeout()
+        if _next_info is not None and now >= _next_info:
+            _next_info = now + INFO_INTERVAL
+            print_info(debug_info.get("depth", 0) + 1)
+
+
+def get_capture_moves(board: CompactBoard) -> List[int]:
+    """
+    Get pseudo-legal captures and queen promotions, most valuable victim first.
+    """
+    return get_tactical_moves(board)[0]
+
+
+def get_tactical_moves(board: CompactBoard) -> Tuple[List[int], List[int]]:
+    """
+    Split the pseudo-legal captures and promotions into:
+    - captures and queen promotions, most valuable victim first
+    - a stronger piece taking a defended weaker piece (a cheap stand-in for a static
+      exchange evaluation) and under-promotions
+    """
+    moves = []
+    losing_moves = []
+    squares = board.squares
+    opponent = not board.turn
+    for move in board.generate_tactical():
+        promotion = (move >> 14) & 7
+        if promotion:
+            if promotion == chess.QUEEN:
+                moves.append(move)
+            else:
+                losing_moves.append(move)
+            continue
+        to_square = (move >> 7) & 127
+        if board.captured_value(move) >= MATERIAL[squares[move & 127]] or not board.is_attacked(
+            to_square, opponent
+        ):
+            moves.append(move)
+        else:
+            losing_moves.append(move)
+
+    moves.sort(key=board.mvv_lva, reverse=True)
+    return moves, losing_moves
+
+
+def negamax_root(
+    depth: int,
+    board: CompactBoard,
+    pv_move: int = NULL_MOVE,
+    alpha: int = -INFINITY,
+    beta: int = INFINITY,
+) -> Tuple[int, int]:
     """
     What is the highest value move per our evaluation function?
+    The score is from the point of view of the side to move.
+    The best move of the previous iteration (`pv_move`) is searched first, and the
+    rest only have to prove they are worse than the best so far (as in negamax()).
+    A score at or below `alpha`, or at or above `beta`, only bounds the true score.
+    Leaves the principal variation in pv_table[0].
     """
-    # White always wants to maximize (and black to minimize)
-    # the board score according to evaluate_board()
-    maximize = board.turn == chess.WHITE
-    best_move = -float("inf")
-    if not maximize:
-        best_move = float("inf")
+    global _iteration_best
+    _iteration_best = None
+    alpha_orig = alpha
+    best_move = -INFINITY
+    pv_table[0] = []
 
-    moves = get_ordered_moves(board)
+    key = board.zobrist_key()
+    if pv_move == NULL_MOVE:
+        entry = transposition_table.probe(key)
+        pv_move = entry.move if entry and entry.move is not None else NULL_MOVE
+    moves = [move for move in get_ordered_moves(board, pv_move) if is_legal(board, move)]
+    if _root_filter is not None:
+        moves = [move for move in moves if move in _root_filter]
     best_move_found = moves[0]
 
-    for move in moves:
+    parallel_moves: List[int] = []
+    if _pool is not None and depth > 1:
+        # Search the expected best move here to get a score to beat,
+        # then share out the rest between the workers
+        parallel_moves = moves[1:]
+        moves = moves[:1]
+
+    for index, move in enumerate(moves):
         board.push(move)
-        # Checking if draw can be claimed at this level, because the threefold repetition check
-        # can be expensive. This should help the bot avoid a draw if it's not favorable
-        # https://python-chess.readthedocs.io/en/latest/core.html#chess.Board.can_claim_draw
-        if board.can_claim_draw():
-            value = 0.0
+        # Repetitions are scored as draws by negamax(), which helps the bot
+        # avoid a draw if it's not favorable
+        if index == 0:
+            value = -negamax(depth - 1, board, -beta, -alpha, 1)
         else:
-            value = minimax(depth - 1, board, -float("inf"), float("inf"), not maximize)
+            value = -negamax(depth - 1, board, -alpha - 1, -alpha, 1)
+            if alpha < value < beta:
+                value = -negamax(depth - 1, board, -beta, -alpha, 1)
         board.pop()
-        if maximize and value >= best_move:
-            best_move = value
-            best_move_found = move
-        elif not maximize and value <= best_move:
+        value = mate_distance(value)
+        if value > best_move:
             best_move = value
             best_move_found = move
+            if value > alpha:
+                alpha = value
+                pv_table[0] = [move] + pv_table[1]
+                # Strictly better than every move before it, so safe to play
+                # if the iteration is cut short
+                _iteration_best = (best_move_found, best_move)
+        if alpha >= beta:
+            break
+
+    if _pool is not None and parallel_moves and alpha < beta:
+        _shared_alpha.value = alpha
+        _shared_nodes.value = 0
+        # What is left of the node budget, for the workers to share
+        node_limit = None if _node_limit is None else _node_limit - debug_info["nodes"]
+        fen, game = _root_game
+        tasks = [
+            (
+                fen,
+                game,
+                move_uci(move),
+                depth,
+                beta,
+                _deadline,
+                _game_id,
+                _search_id,
+                node_limit,
+                transposition_table.size_mb,
+                dict(syzygy_options),
+            )
+            for move in parallel_moves
+        ]
+        timed_out = False
+        for uci, score, counters, pv in _pool.imap_unordered(search_root_move, tasks):
+            for name, count in counters.items():
+                if name == "seldepth":
+                    debug_info[name] = max(debug_info[name], count)
+                else:
+                    debug_info[name] = debug_info.get(name, 0) + count
+            if score is None:
+                timed_out = True
+            elif score > best_move:
+                best_move = score
+                best_move_found = board.parse_uci(uci)
+                if score > alpha:
+                    # Workers that start later search against the better score
+                    alpha = score
+                    _shared_alpha.value = alpha
+                    # The worker's line, replayed to read its moves
+                    pv_table[0] = [best_move_found]
+                    board.push(best_move_found)
+                    for pv_uci in pv:
+                        pv_table[0].append(board.parse_uci(pv_uci))
+                        board.push(pv_table[0][-1])
+                    for _ in pv_table[0]:
+                        board.pop()
+                    _iteration_best = (best_move_found, best_move)
+        if timed_out:
+            raise SearchTimeout()
+
+    if best_move <= alpha_orig:
+        flag = UPPERBOUND
+    elif best_move >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    transposition_table.store(key, depth, best_move, flag, best_move_found)
+    return best_move_found, best_move
+
+
+def aspiration_search(depth: int, board: CompactBoard, pv_move: int, guess: int) -> Tuple[int, int]:
+    """
+    Search the root in a narrow window around `guess`, the previous iteration's score:
+    the narrower the window, the more of the tree is cut off.
+    When the score falls outside, the window is widened on that side and the root searched again.
+    https://www.chessprogramming.org/Aspiration_Windows
+    """
+    if abs(guess) >= TB_WIN_SCORE - MAX_DEPTH:
+        # Mates and tablebase results jump by more than any window
+        return negamax_root(depth, board, pv_move)
+    delta = ASPIRATION_WINDOW
+    alpha, beta = guess - delta, guess + delta
+    while True:
+        move, score = negamax_root(depth, board, pv_move, alpha, beta)
+        if alpha < score < beta:
+            return move, score
+        debug_info["aspiration_researches"] = debug_info.get("aspiration_researches", 0) + 1
+        delta *= ASPIRATION_GROWTH
+        if score <= alpha:
+            alpha = guess - delta if delta < ASPIRATION_LIMIT else -INFINITY
+        else:
+            beta = guess + delta if delta < ASPIRATION_LIMIT else INFINITY
+            # The move that failed high is the one to beat
+            pv_move = move
+
+
+def is_legal(board: CompactBoard, move: int) -> bool:
+    """
+    Does a pseudo-legal move keep the king out of check?
+    """
+    board.push(move)
+    legal = board.was_legal()
+    board.pop()
+    return legal
+
+
+def hash_line(board: CompactBoard, length: int) -> List[int]:
+    """
+    Up to `length` moves, following the transposition table's best move from each
+    position in turn, as long as they are legal and don't repeat a position.
+    """
+    line: List[int] = []
+    while len(line) < length:
+        entry = transposition_table.probe(board.zobrist_key())
+        if entry is None or entry.move is None:
+            break
+        if not board.is_pseudo_legal(entry.move) or not is_legal(board, entry.move):
+            break
+        board.push(entry.move)
+        line.append(entry.move)
+        if board.is_repetition():
+            break
+    for _ in line:
+        board.pop()
+    return line
+
+
+def search_root_move(
+    task: Tuple[
+        str, List[str], str, int, int, Optional[float], int, int, Optional[int], int, Dict[str, Any]
+    ]
+) -> Tuple[str, Optional[int], Dict[str, int], List[str]]:
+    """
+    Runs in a worker process: is this root move better than the best score so far?
+    Returns the move, its score (None when out of time or nodes), the search's
+    counters (as in debug_info) and the line expected after the move.
+    A score at or below the shared alpha only means the move is no better,
+    and one at or above `beta` that it is at least that good.
+    """
+    global _deadline, _game_id, _search_id, _worker_board, _tb_pieces, _node_limit, _node_counter
+    (
+        fen, game, uci, depth, beta, deadline, game_id, search_id, node_limit, hash_mb, tablebase_options
+    ) = task
+    if hash_mb != transposition_table.size_mb:
+        # Each worker has a table of the size set by the Hash option
+        transposition_table.resize(hash_mb)
+    if tablebase_options["SyzygyPath"] != syzygy_options["SyzygyPath"]:
+        open_tablebase(tablebase_options["SyzygyPath"])
+    syzygy_options["SyzygyProbeLimit"] = tablebase_options["SyzygyProbeLimit"]
+    _tb_pieces = piece_limit()
+    if game_id != _game_id:
+        new_game()
+        _game_id = game_id
+        _search_id = 0
+    if search_id != _search_id:
+        _search_id = search_id
+        transposition_table.new_search()
+        age_move_ordering()
+        root = chess.Board(fen)
+        for move in game:
+            root.push_uci(move)
+        _worker_board = (search_id, CompactBoard.from_board(root))
+    assert _worker_board is not None
+    board = _worker_board[1]
+
+    debug_info.clear()
+    debug_info.update(nodes=0, seldepth=0, tt_hits=0, tt_misses=0, tb_hits=0, null_move_cutoffs=0)
+    if node_limit is not None and _shared_nodes.value >= node_limit:
+        # The other workers have spent the budget already
+        return uci, None, dict(debug_info), []
+    _deadline = deadline
+    if node_limit is not None:
+        _node_limit = node_limit
+        _node_counter = _shared_nodes
+    alpha = _shared_alpha.value
+    board.push(board.parse_uci(uci))
+    try:
+        # Prove the move is no better than the best so far, unless it is
+        value = -negamax(depth - 1, board, -alpha - 1, -alpha, 1)
+        if alpha < value < beta:
+            value = -negamax(depth - 1, board, -beta, -alpha, 1)
+        value = mate_distance(value)
+    except SearchTimeout:
+        # The board was left mid-search
+        _search_id = 0
+        return uci, None, dict(debug_info), []
+    finally:
+        if _node_counter is not None:
+            # The nodes since the last whole 256 count_node() added
+            with _node_counter.get_lock():
+                _node_counter.value += debug_info["nodes"] % 256
+        _deadline = None
+        _node_limit = None
+        _node_counter = None
+    board.pop()
+
+    with _shared_alpha.get_lock():
+        if value > _shared_alpha.value:
+            _shared_alpha.value = value
+    return uci, value, dict(debug_info), [move_uci(move) for move in pv_table[1]]
+
+
+def perft(board: CompactBoard, depth: int) -> int:
+    """
+    Count the move paths `depth` plies deep: a check (and a benchmark) of move generation.
+    https://www.chessprogramming.org/Perft
+    """
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in board.generate_pseudo_legal():
+        board.push(move)
+        if board.was_legal():
+            nodes += perft(board, depth - 1) if depth > 1 else 1
+        board.pop()
+    return nodes
 
-    return best_move_found
 
+def perft_chess(board: chess.Board, depth: int) -> int:
+    """
+    perft() with python-chess, to compare against.
+    """
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft_chess(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def divide(board: chess.Board, depth: int, compact: bool = True) -> List[Tuple[chess.Move, int]]:
+    """
+    Perft split by root move, to narrow down where two move generators disagree.
+    Counted on a CompactBoard, or with python-chess when not `compact`.
+    """
+    counts = []
+    if compact:
+        compact_board = CompactBoard.from_board(board)
+        for move in compact_board.generate_legal():
+            compact_board.push(move)
+            counts.append((to_chess_move(move), perft(compact_board, depth - 1)))
+            compact_board.pop()
+    else:
+        board = board.copy()
+        for chess_move in list(board.legal_moves):
+            board.push(chess_move)
+            counts.append((chess_move, perft_chess(board, depth - 1)))
+            board.pop()
+    counts.sort(key=lambda count: count[0].uci())
+    return counts
 
-def minimax(
+
+def mate_distance(score: int) -> int:
+    """
+    Each ply after a checkmate is slower, so they get ranked slightly less.
+    We want the fastest mate!
+    """
+    if score > MATE_THRESHOLD:
+        return score - 1
+    elif score < -MATE_THRESHOLD:
+        return score + 1
+    return score
+
+
+def negamax(
     depth: int,
-    board: chess.Board,
-    alpha: float,
-    beta: float,
-    is_maximising_player: bool,
-) -> float:
+    board: CompactBoard,
+    alpha: int,
+    beta: int,
+    ply: int,
+) -> int:
     """
-    Core minimax logic.
-    https://en.wikipedia.org/wiki/Minimax
+    Core search logic.
+    Scores are from the point of view of the side to move, so each side maximizes
+    the negation of its opponent's score.
+    The first (expected best) move is searched with the full window, and the rest
+    with a null window that only proves they are worse, re-searching any that aren't.
+    https://www.chessprogramming.org/Principal_Variation_Search
+    `ply` is the distance from the root.
+    The line expected from here is left in pv_table[ply].
     """
-    debug_info["nodes"] += 1
+    count_node()
+    pv_table[ply] = []
+    if ply > debug_info["seldepth"]:
+        debug_info["seldepth"] = ply
 
-    if board.is_checkmate():
-        # The previous move resulted in checkmate
-        return -MATE_SCORE if is_maximising_player else MATE_SCORE
-    # When the game is over and it's not a checkmate it's a draw
+    # A repeated position is a draw: whatever was best the first time is best again.
     # In this case, don't evaluate. Just return a neutral result: zero
-    elif board.is_game_over():
+    if board.is_repetition() or board.is_insufficient_material():
         return 0
+    if board.halfmove_clock >= 100 and not board.is_checkmate():
+        return 0
+
+    # Endgame tablebases know the result exactly. Only probed straight after a capture
+    # or pawn move, where the fifty-move count can't make the result out of date
+    if (
+        board.halfmove_clock == 0
+        and not board.castling
+        and len(board.pieces[0]) + len(board.pieces[1]) <= _tb_pieces
+    ):
+        wdl = probe_wdl(board)
+        if wdl is not None:
+            debug_info["tb_hits"] += 1
+            return wdl_score(wdl, ply)
 
     if depth == 0:
-        return evaluate_board(board)
-
-    if is_maximising_player:
-        best_move = -float("inf")
-        moves = get_ordered_moves(board)
-        for move in moves:
-            board.push(move)
-            curr_move = minimax(depth - 1, board, alpha, beta, not is_maximising_player)
-            # Each ply after a checkmate is slower, so they get ranked slightly less
-            # We want the fastest mate!
-            if curr_move > MATE_THRESHOLD:
-                curr_move -= 1
-            elif curr_move < -MATE_THRESHOLD:
-                curr_move += 1
-            best_move = max(
-                best_move,
-                curr_move,
-            )
+        if board.is_checkmate():
+            # The previous move resulted in checkmate
+            return -MATE_SCORE
+        return quiescence(board, alpha, beta, ply)
+
+    key = board.zobrist_key()
+    entry = transposition_table.probe(key)
+    hash_move = NULL_MOVE
+    if entry is None:
+        debug_info["tt_misses"] += 1
+    else:
+        debug_info["tt_hits"] += 1
+        if entry.move is not None:
+            hash_move = entry.move
+        if entry.depth >= depth:
+            if entry.flag == EXACT:
+                if beta - alpha > 1:
+                    # A PV node: the rest of the line is the table's best moves from here
+                    pv_table[ply] = hash_line(board, min(entry.depth, MAX_DEPTH - ply))
+                return entry.score
+            # Bounds only cut off, rather than narrowing the window: a PV node searched
+            # with its alpha raised by the table would have no move to put in the PV
+            if entry.flag == LOWERBOUND and entry.score >= beta:
+                return entry.score
+            if entry.flag == UPPERBOUND and entry.score <= alpha:
+                return entry.score
+    alpha_orig = alpha
+    in_check = board.is_check()
+
+    # Null-move pruning: if passing the turn still fails high, a real move would too.
+    # Not in the end game, where zugzwang makes passing better than any real move,
+    # nor twice in a row or when a mate score is at stake.
+    if (
+        search_options["NullMove"]
+        and depth > NULL_MOVE_REDUCTION
+        and beta - alpha == 1
+        and not in_check
+        and abs(beta) < MATE_THRESHOLD
+        and board.peek() != NULL_MOVE
+        and not board.is_end_game()
+    ):
+        board.push_null()
+        null_move = -negamax(depth - 1 - NULL_MOVE_REDUCTION, board, -beta, -beta + 1, ply + 1)
+        board.pop()
+        if null_move >= beta:
+            debug_info["null_move_cutoffs"] = debug_info.get("null_move_cutoffs", 0) + 1
+            return beta
+
+    best_move = -INFINITY
+    best_move_found = NULL_MOVE
+    killers = killer_moves[ply]
+    index = 0
+    for move in get_ordered_moves(board, hash_move, killers, history[board.turn]):
+        # Late move reductions: quiet moves this far down the ordering rarely turn out best,
+        # so prove it with a shallower search first
+        reduction = 0
+        if (
+            search_options["LMR"]
+            and index >= LMR_MOVES
+            and depth >= LMR_DEPTH
+            and not in_check
+            and not (move >> 14) & 7
+            and move not in killers
+            and not board.is_capture(move)
+        ):
+            reduction = 1
+
+        board.push(move)
+        if not board.was_legal():
             board.pop()
-            alpha = max(alpha, best_move)
-            if beta <= alpha:
-                return best_move
-        return best_move
+            continue
+        if reduction and board.is_check():
+            reduction = 0
+        if index == 0:
+            curr_move = -negamax(depth - 1, board, -beta, -alpha, ply + 1)
+        else:
+            curr_move = -negamax(depth - 1 - reduction, board, -alpha - 1, -alpha, ply + 1)
+            if reduction and curr_move > alpha:
+                curr_move = -negamax(depth - 1, board, -alpha - 1, -alpha, ply + 1)
+            if alpha < curr_move < beta:
+                curr_move = -negamax(depth - 1, board, -beta, -alpha, ply + 1)
+        board.pop()
+        index += 1
+        curr_move = mate_distance(curr_move)
+
+        if curr_move > best_move:
+            best_move = curr_move
+            best_move_found = move
+            if curr_move > alpha:
+                pv_table[ply] = [move] + pv_table[ply + 1]
+        alpha = max(alpha, best_move)
+        if alpha >= beta:
+            record_cutoff(board, move, depth, ply)
+            break
+
+    if best_move_found == NULL_MOVE:
+        # No legal moves: checkmate or stalemate
+        return -MATE_SCORE if in_check else 0
+
+    if best_move <= alpha_orig:
+        flag = UPPERBOUND
+    elif best_move >= beta:
+        flag = LOWERBOUND
     else:
-        best_move = float("inf")
-        moves = get_ordered_moves(board)
-        for move in moves:
-            board.push(move)
-            curr_move = minimax(depth - 1, board, alpha, beta, not is_maximising_player)
-            if curr_move > MATE_THRESHOLD:
-                curr_move -= 1
-            elif curr_move < -MATE_THRESHOLD:
-                curr_move += 1
-            best_move = min(
-                best_move,
-                curr_move,
-            )
+        flag = EXACT
+    transposition_table.store(key, depth, best_move, flag, best_move_found)
+    return best_move
+
+
+def quiescence(board: CompactBoard, alpha: int, beta: int, ply: int) -> int:
+    """
+    Keep searching captures and promotions past the horizon until the position is quiet,
+    so the evaluation isn't taken in the middle of an exchange.
+    The side to move may also "stand pat" and decline every capture.
+    https://www.chessprogramming.org/Quiescence_Search
+    """
+    count_node()
+    if ply > debug_info["seldepth"]:
+        debug_info["seldepth"] = ply
+
+    stand_pat = board.evaluate()
+    if board.turn == chess.BLACK:
+        stand_pat = -stand_pat
+    if stand_pat >= beta:
+        return stand_pat
+    alpha = max(alpha, stand_pat)
+    best_move = stand_pat
+
+    # Near the end of the game a few pawns can be worth more than their material
+    delta_pruning = not board.is_end_game()
+
+    for move in get_capture_moves(board):
+        if delta_pruning:
+            optimistic = stand_pat + board.captured_value(move) + DELTA_MARGIN
+            if optimistic < alpha:
+                # A score below alpha is only an upper bound, so it has to allow
+                # for what the skipped capture might have been worth
+                best_move = max(best_move, optimistic)
+                continue
+        board.push(move)
+        if not board.was_legal():
             board.pop()
-            beta = min(beta, best_move)
-            if beta <= alpha:
-                return best_move
-        return best_move
+            continue
+        curr_move = -quiescence(board, -beta, -alpha, ply + 1)
+        board.pop()
+        best_move = max(best_move, curr_move)
+        alpha = max(alpha, best_move)
+        if alpha >= beta:
+            break
+    return best_move
@@ -0,0 +1,427 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import chess
+import book
+import communication
+import movegeneration
+import tablebase
+from movegeneration import MAX_DEPTH, HISTORY_MASK, next_move, uci_score
+from transposition import TranspositionTable
+
+# Many sessions share a worker's memory, so each gets a smaller table than the engine's default
+SESSION_HASH_MB = 4
+MAX_SESSION_HASH_MB = 64
+
+# Search tables a worker keeps, for the sessions it served most recently
+SESSIONS_PER_WORKER = 32
+
+# Search depth of a `go` without a clock, as `main.py --depth`
+DEFAULT_DEPTH = 3
+
+# Options each session can set, with their defaults
+SESSION_OPTIONS: Dict[str, Any] = {
+    "Hash": SESSION_HASH_MB,
+    "NullMove": True,
+    "LMR": True,
+    "OwnBook": False,
+    "BookBestMove": False,
+}
+
+# A search for a session: its id and stop flag slot, its game number (a new one
+# for every ucinewgame), the starting FEN and moves, depth, time and node limits, and options
+SearchTask = Tuple[
+    int, int, int, str, List[str], int, Optional[float], Optional[int], Dict[str, Any]
+]
+
+
+class StopFlag:
+    """
+    Tells the search in a worker to stop: one byte per session, shared with the server.
+    """
+
+    def __init__(self, flags: Any, slot: int):
+        self.flags = flags
+        self.slot = slot
+
+    def is_set(self) -> bool:
+        return self.flags[self.slot] != 0
+
+
+# In each worker process: the shared stop flags, and search tables by session
+_stop_flags: Any = None
+_session_tables: Dict[int, Tuple[int, int, TranspositionTable, List[List[int]], List[List[int]]]] = (
+    collections.OrderedDict()
+)
+
+
+def _init_worker(stop_flags: Any, book_path: str, syzygy_path: str):
+    """
+    Load what all sessions share once per worker: the evaluation tables come with
+    the imports, the book is memory-mapped and the tablebases are opened lazily.
+    """
+    global _stop_flags
+    _stop_flags = stop_flags
+    if book_path:
+        book.open_book(book_path)
+    if syzygy_path:
+        tablebase.open_tablebase(syzygy_path)
+
+
+def search(task: SearchTask) -> Dict[str, Any]:
+    """
+    Runs in a worker process: search a session's position with that session's tables.
+    """
+    session_id, slot, game, fen, moves, depth, time_limit, node_limit, options = task
+    tables = _session_tables.pop(session_id, None)
+    if tables is None or tables[:2] != (game, options["Hash"]):
+        tables = (
+            game,
+            options["Hash"],
+            TranspositionTable(options["Hash"]),
+            [[] for _ in range(MAX_DEPTH + 1)],
+            [[0] * (HISTORY_MASK + 1), [0] * (HISTORY_MASK + 1)],
+        )
+    _session_tables[session_id] = tables
+    while len(_session_tables) > SESSIONS_PER_WORKER:
+        del _session_tables[next(iter(_session_tables))]
+    _, _, movegeneration.transposition_table, movegeneration.killer_moves, movegeneration.history = tables
+    for option in movegeneration.search_options:
+        movegeneration.search_options[option] = options[option]
+    for option in book.book_options:
+        book.book_options[option] = options[option]
+    movegeneration.set_stop_event(StopFlag(_stop_flags, slot))
+
+    board = chess.Board(fen)
+    for move in moves:
+        board.push_uci(move)
+    t0 = time.time()
+    best_move = next_move(
+        depth, board, debug=False, time_limit=time_limit, node_limit=node_limit
+    )
+    info = movegeneration.debug_info
+    return {
+        "bestmove": best_move.uci(),
+        "depth": info.get("depth", 0),
+        "seldepth": info.get("seldepth", 0),
+        "score": info.get("score"),
+        "nodes": info.get("nodes", 0),
+        "time": time.time() - t0,
+        "pv": info.get("pv", []),
+    }
+
+
+class Worker:
+    """
+    One search process. A session's searches always go to the same worker, which
+    keeps its transposition table, killers and history between them.
+    """
+
+    def __init__(self, context: Any, stop_flags: Any, book_path: str, syzygy_path: str):
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(stop_flags, book_path, syzygy_path),
+        )
+        self.sessions = 0
+        # Searches submitted and not yet finished; all but one are waiting
+        self.pending = 0
+
+
+class Server:
+    """
+    Many UCI sessions over sockets, sharing a fixed number of search processes.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_sessions: int = 256,
+        depth: int = DEFAULT_DEPTH,
+        book_path: str = "",
+        syzygy_path: str = "",
+    ):
+        context = multiprocessing.get_context("spawn")
+        self.stop_flags = context.Array("b", max_sessions, lock=False)
+        self.workers = [
+            Worker(context, self.stop_flags, book_path, syzygy_path) for _ in range(workers)
+        ]
+        self.depth = depth
+        self.free_slots = list(range(max_sessions - 1, -1, -1))
+        self.sessions: Dict[int, "Session"] = {}
+        self.next_session_id = 0
+        # Searches that raised instead of returning a move
+        self.search_errors = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Open sessions, searches waiting for a worker, failed searches, and each
+        session's latency: the time from `go` to `bestmove`, in milliseconds.
+        """
+        return {
+            "sessions": len(self.sessions),
+            "searching": sum(min(worker.pending, 1) for worker in self.workers),
+            "queue_depth": sum(max(worker.pending - 1, 0) for worker in self.workers),
+            "search_errors": self.search_errors,
+            "latency_ms": {
+                session_id: session.latency() for session_id, session in self.sessions.items()
+            },
+        }
+
+    async def run_search(self, session: "Session", task: SearchTask) -> Dict[str, Any]:
+        worker = session.worker
+        worker.pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(worker.executor, search, task)
+        finally:
+            worker.pending -= 1
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if not self.free_slots:
+            writer.write(b"info string too many sessions\n")
+            await writer.drain()
+            writer.close()
+            return
+        self.next_session_id += 1
+        # The worker with the fewest sessions takes the new one
+        worker = min(self.workers, key=lambda worker: worker.sessions)
+        session = Session(self, self.next_session_id, self.free_slots.pop(), worker, writer)
+        worker.sessions += 1
+        self.sessions[session.id] = session
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    if not await session.command(line.decode().strip()):
+                        break
+                except ValueError as error:
+                    # A bad move or option value: say so, and carry on with the session
+                    session.send(f"info string {error}")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.sessions[session.id]
+            await session.close()
+            worker.sessions -= 1
+            self.free_slots.append(session.slot)
+            writer.close()
+
+    def close(self):
+        for worker in self.workers:
+            worker.executor.shutdown()
+
+
+class Session:
+    """
+    A UCI session: its own board, options and game, with searches run by a worker.
+    """
+
+    def __init__(
+        self, server: Server, session_id: int, slot: int, worker: Worker, writer: asyncio.StreamWriter
+    ):
+        self.server = server
+        self.id = session_id
+        self.slot = slot
+        self.worker = worker
+        self.writer = writer
+        self.board = chess.Board()
+        self.position: Dict[str, Any] = {}
+        self.game = 0
+        self.options = dict(SESSION_OPTIONS)
+        self.search: Optional["asyncio.Task[None]"] = None
+        self.stopped = asyncio.Event()
+        self.latencies: List[float] = []
+
+    def send(self, line: str):
+        self.writer.write((line + "\n").encode())
+
+    def latency(self) -> Dict[str, Any]:
+        if not self.latencies:
+            return {"searches": 0}
+        return {
+            "searches": len(self.latencies),
+            "last": round(self.latencies[-1] * 1000, 1),
+            "mean": round(sum(self.latencies) / len(self.latencies) * 1000, 1),
+            "max": round(max(self.latencies) * 1000, 1),
+        }
+
+    async def command(self, msg: str) -> bool:
+        """
+        Handle a line from the client. False when the session is over.
+        """
+        tokens = msg.split()
+        if not tokens:
+            return True
+        searching = self.search is not None and not self.search.done()
+
+        if tokens == ["isready"]:
+            self.send("readyok")
+        elif tokens in (["stop"], ["ponderhit"]):
+            # Searches here don't carry on after a ponderhit: the move is played at once
+            self.server.stop_flags[self.slot] = 1
+            self.stopped.set()
+        elif tokens == ["quit"]:
+            return False
+        elif tokens == ["metrics"]:
+            # Non-standard: the server's metrics as JSON
+            self.send("info string " + json.dumps(self.server.metrics()))
+        elif searching:
+            # Anything else waits for the search to finish
+            await self.wait()
+            return await self.command(msg)
+        elif tokens == ["uci"]:
+            self.send("id name Andoma")
+            self.send("id author Andrew Healey & Roma Parramore")
+            self.send(f"option name Hash type spin default {SESSION_HASH_MB} min 1 max {MAX_SESSION_HASH_MB}")
+            self.send("option name NullMove type check default true")
+            self.send("option name LMR type check default true")
+            self.send("option name OwnBook type check default false")
+            self.send("option name BookBestMove type check default false")
+            self.send("uciok")
+        elif tokens == ["ucinewgame"]:
+            self.game += 1
+        elif tokens[0] == "setoption":
+            self.set_option(tokens)
+        elif tokens[0] == "position":
+            position = communication.get_position(tokens)
+            if position is not None:
+                try:
+                    communication.set_position(self.board, *position, self.position)
+                except ValueError:
+                    # Don't leave a position half set up for the next search
+                    self.board.reset()
+                    self.position.clear()
+                    raise
+        elif tokens[0] == "go":
+            self.server.stop_flags[self.slot] = 0
+            self.stopped.clear()
+            self.search = asyncio.ensure_future(self.go(tokens))
+        elif tokens == ["d"]:
+            self.send(str(self.board))
+            self.send(self.board.fen())
+        await self.writer.drain()
+        return True
+
+    def set_option(self, tokens: List[str]):
+        """
+        Handle `setoption name <id> value <x>` for the options sessions have.
+        The book and tablebases are set for the whole server.
+        """
+        if "name" not in tokens or "value" not in tokens:
+            return
+        name_start = tokens.index("name") + 1
+        value_start = tokens.index("value")
+        name = " ".join(tokens[name_start:value_start]).lower()
+        value = " ".join(tokens[(value_start+1):])
+        for option, default in SESSION_OPTIONS.items():
+            if name != option.lower():
+                continue
+            if isinstance(default, bool):
+                self.options[option] = value.lower() == "true"
+            else:
+                self.options[option] = min(max(int(value), 1), MAX_SESSION_HASH_MB)
+
+    async def go(self, tokens: List[str]):
+        t0 = time.time()
+        if self.board.is_game_over():
+            self.send("bestmove 0000")
+            return
+        params = communication.get_go_parameters(tokens)
+        time_limit = communication.get_time_limit(params, self.board.turn)
+        if "infinite" in params:
+            depth = MAX_DEPTH
+        else:
+            depth = communication.get_depth_limit(params, self.server.depth, time_limit)
+        task = (
+            self.id,
+            self.slot,
+            self.game,
+            self.position.get("fen", chess.STARTING_FEN),
+            self.position.get("moves", []),
+            depth,
+            time_limit,
+            params.get("nodes"),
+            dict(self.options),
+        )
+        try:
+            result = await self.server.run_search(self, task)
+        except Exception as error:
+            # The client is still owed a move, if there is one
+            self.server.search_errors += 1
+            print(f"session {self.id}: search failed: {error!r}", file=sys.stderr, flush=True)
+            self.send(f"info string {type(error).__name__}: {error}")
+            move = next(iter(self.board.legal_moves), None)
+            self.send(f"bestmove {move or '0000'}")
+            await self.writer.drain()
+            return
+        if "infinite" in params or "ponder" in params:
+            # Only answer once told to stop
+            await self.stopped.wait()
+        line = f"info depth {result['depth']} seldepth {result['seldepth']}"
+        if result["score"] is not None:
+            line += f" score {uci_score(result['score'])}"
+        line += f" nodes {result['nodes']} time {int(result['time'] * 1000)}"
+        if result["pv"]:
+            line += " pv " + " ".join(result["pv"])
+        self.send(line)
+        self.send(f"bestmove {result['bestmove']}")
+        self.latencies.append(time.time() - t0)
+        await self.writer.drain()
+
+    async def wait(self):
+        if self.search is not None:
+            await asyncio.gather(self.search, return_exceptions=True)
+
+    async def close(self):
+        """
+        The client has gone: stop its search, and wait for the worker to let go of the stop flag.
+        """
+        self.server.stop_flags[self.slot] = 1
+        self.stopped.set()
+        await self.wait()
+
+
+async def serve(
+    server: Server, host: str = "127.0.0.1", port: int = 0, unix: Optional[str] = None
+) -> asyncio.AbstractServer:
+    """
+    Listen on a TCP port, or on a Unix socket when `unix` is a path.
+    """
+    if unix is not None:
+        return await asyncio.start_unix_server(server.handle, path=unix)
+    return await asyncio.start_server(server.handle, host, port)
+
+
+async def main(args: argparse.Namespace):
+    server = Server(args.workers, args.max_sessions, args.depth, args.book, args.syzygy)
+    listener = await serve(server, args.host, args.port, args.unix)
+    print(f"listening on {args.unix or (args.host, args.port)}", flush=True)
+    try:
+        await listener.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve UCI sessions over TCP or a Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes")
+    parser.add_argument("--max-sessions", type=int, default=256)
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="depth of a go without a clock")
+    parser.add_argument("--book", default="", help="Polyglot opening book shared by all sessions")
+    parser.add_argument("--syzygy", default="", help="Syzygy tablebase directories shared by all sessions")
+    asyncio.run(main(parser.parse_args()))
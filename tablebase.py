@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import chess
+import chess.syzygy
+from compactboard import CompactBoard
+
+# Syzygy endgame tablebases: exact results for positions with few pieces
+# https://www.chessprogramming.org/Syzygy_Bases
+# WDL values are from the side to move's point of view:
+# 2 win, 1 win that the fifty-move rule turns into a draw, 0 draw, -1 and -2 the same for losses.
+# DTZ is the number of plies to the next capture or pawn move on the best line (signed like WDL).
+
+# Score of a won position, less the distance from the root so sooner is better.
+# Above any evaluation, but below the mate scores
+TB_WIN_SCORE = 100000
+
+# Probe results by Zobrist key. Positions don't change, so this is only
+# cleared when the tables do, or when it is full
+CACHE_SIZE = 1 << 16
+
+# Can be set with the UCI options of the same name
+syzygy_options: Dict[str, Any] = {
+    # Directories holding the tables
+    "SyzygyPath": "",
+    # Don't probe positions with more pieces than this
+    "SyzygyProbeLimit": 7,
+}
+
+_tablebase: Optional[Any] = None
+# Pieces in the largest table loaded
+_max_pieces = 0
+_wdl_cache: Dict[int, Optional[int]] = {}
+
+
+def open_tablebase(path: str):
+    """
+    Use the tables in `path` (directories separated by os.pathsep), or none for an empty path.
+    """
+    global _tablebase, _max_pieces
+    close_tablebase()
+    if not path:
+        return
+    tablebase = chess.syzygy.Tablebase()
+    try:
+        for directory in path.split(os.pathsep):
+            if directory:
+                tablebase.add_directory(directory)
+    except OSError:
+        tablebase.close()
+        raise
+    _tablebase = tablebase
+    syzygy_options["SyzygyPath"] = path
+    # Table names are the pieces, white then black: KQvKR
+    _max_pieces = max((len(name) - 1 for name in tablebase.wdl), default=0)
+
+
+def close_tablebase():
+    global _tablebase, _max_pieces
+    if _tablebase is not None:
+        _tablebase.close()
+    _tablebase = None
+    _max_pieces = 0
+    _wdl_cache.clear()
+    syzygy_options["SyzygyPath"] = ""
+
+
+def piece_limit() -> int:
+    """
+    Positions with at most this many pieces (kings included) can be probed.
+    """
+    if _tablebase is None:
+        return 0
+    return min(_max_pieces, syzygy_options["SyzygyProbeLimit"])
+
+
+def probe_wdl(board: CompactBoard) -> Optional[int]:
+    """
+    Win/draw/loss for the side to move, or None when there is no table for the position.
+    """
+    key = board.zobrist_key()
+    if key in _wdl_cache:
+        return _wdl_cache[key]
+    if len(_wdl_cache) >= CACHE_SIZE:
+        _wdl_cache.clear()
+    try:
+        wdl: Optional[int] = None
+        if _tablebase is not None:
+            wdl = _tablebase.probe_wdl(board.to_board())
+    except KeyError:
+        wdl = None
+    _wdl_cache[key] = wdl
+    return wdl
+
+
+def wdl_score(wdl: int, ply: int) -> int:
+    """
+    Search score for a probed position `ply` plies from the root.
+    Wins and losses the fifty-move rule spoils are draws.
+    """
+    if wdl > 1:
+        return TB_WIN_SCORE - ply
+    if wdl < -1:
+        return -TB_WIN_SCORE + ply
+    return 0
+
+
+def root_moves(board: chess.Board) -> Optional[Tuple[int, List[chess.Move]]]:
+    """
+    At the root: the best WDL and the moves that keep it, best first.
+    Winning moves are ordered by how soon they make progress (DTZ), losing ones by how long
+    they hold out. Drawing moves aren't ordered; the search picks among them.
+    None when the position isn't in the tables.
+    """
+    if (
+        _tablebase is None
+        or chess.popcount(board.occupied) > piece_limit()
+        or board.castling_rights
+    ):
+        return None
+    results = []
+    try:
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                wdl = -_tablebase.probe_wdl(board)
+                dtz = -_tablebase.probe_dtz(board)
+            finally:
+                board.pop()
+            if wdl > 0 and board.is_zeroing(move):
+                # The fifty-move count starts again: progress has been made
+                dtz = 1
+            results.append((wdl, dtz, move))
+    except KeyError:
+        return None
+    if not results:
+        return None
+
+    best_wdl = max(wdl for wdl, _, _ in results)
+    moves = [(dtz, move) for wdl, dtz, move in results if wdl == best_wdl]
+    # Winning: fewest plies to our next zeroing move (positive DTZ).
+    # Losing: most plies to the opponent's (negative DTZ)
+    if best_wdl != 0:
+        moves.sort(key=lambda result: result[0])
+    return best_wdl, [move for _, move in moves]
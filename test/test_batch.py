@@ -0,0 +1,84 @@
+import chess
+import json
+import unittest
+from io import StringIO
+import movegeneration
+from batch import analyse, read_positions
+from movegeneration import next_move, MAX_DEPTH
+
+EPD = """# a comment, then a blank line
+
+rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1
+r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - bm e2a6; id "kiwipete";
+7k/6Q1/6K1/8/8/8/8/8 b - - 0 1
+"""
+
+PGN = """[Event "?"]
+
+1. e4 e5 2. Nf3 *
+
+[Event "?"]
+
+1. d4 *
+"""
+
+
+class TestBatch(unittest.TestCase):
+    def test_read_positions(self):
+        """
+        Test FEN and EPD lines, and every position of PGN games, are read with an id
+        """
+        positions = list(read_positions(StringIO(EPD)))
+        self.assertEqual(
+            [position_id for position_id, _ in positions], ["3", "kiwipete", "5"]
+        )
+        self.assertEqual(positions[0][1], chess.STARTING_FEN)
+
+        positions = list(read_positions(StringIO(PGN), pgn=True))
+        self.assertEqual(
+            [position_id for position_id, _ in positions],
+            ["1:0", "1:1", "1:2", "1:3", "2:0", "2:1"],
+        )
+        self.assertEqual(positions[4][1], chess.STARTING_FEN)
+
+    def test_analyse(self):
+        """
+        Test every position gets a JSON line, in input order
+        """
+        output = StringIO()
+        count, _ = analyse(read_positions(StringIO(EPD)), output, depth=2, workers=2)
+        self.assertEqual(count, 3)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result["id"] for result in results], ["3", "kiwipete", "5"])
+        for result in results[:2]:
+            board = chess.Board(result["fen"])
+            self.assertIn(chess.Move.from_uci(result["bestmove"]), board.legal_moves)
+            self.assertEqual(result["depth"], 2)
+            self.assertGreater(result["nodes"], 0)
+            self.assertIn("cp", result["score"])
+        # checkmate: nothing to search
+        self.assertIsNone(results[2]["bestmove"])
+        self.assertEqual(results[2]["result"], "1-0")
+
+    def test_bad_positions(self):
+        """
+        Test a line that doesn't parse, or an illegal position, gets an error and the rest are searched
+        """
+        lines = "not a fen\n8/8/8/8/8/8/8/K7 w - - 0 1\n" + chess.STARTING_FEN + "\n"
+        output = StringIO()
+        count, _ = analyse(read_positions(StringIO(lines)), output, depth=1, workers=1)
+        self.assertEqual(count, 3)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([result["id"] for result in results], ["1", "2", "3"])
+        self.assertIn("error", results[0])
+        self.assertIn("no black king", results[1]["error"])
+        self.assertNotIn("error", results[2])
+        self.assertIn(chess.Move.from_uci(results[2]["bestmove"]), chess.Board().legal_moves)
+
+    def test_node_limit(self):
+        """
+        Test a search with a node budget stops soon after spending it
+        """
+        movegeneration.new_game()
+        next_move(MAX_DEPTH, chess.Board(), debug=False, node_limit=5000)
+        self.assertLess(movegeneration.debug_info["nodes"], 5000 + 256)
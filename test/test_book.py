@@ -0,0 +1,85 @@
+import chess
+import chess.polyglot
+import os
+import random
+import struct
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+import book
+from communication import command
+
+
+def polyglot_move(uci: str) -> int:
+    move = chess.Move.from_uci(uci)
+    return move.to_square | move.from_square << 6
+
+
+def write_book(path: str, entries):
+    """
+    Write (board, uci, weight) entries as a polyglot book, sorted by key.
+    """
+    rows = sorted(
+        (chess.polyglot.zobrist_hash(board), polyglot_move(uci), weight)
+        for board, uci, weight in entries
+    )
+    with open(path, "wb") as f:
+        for key, move, weight in rows:
+            f.write(struct.pack(">QHHI", key, move, weight, 0))
+
+
+class TestBook(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "book.bin")
+        after_e4 = chess.Board()
+        after_e4.push_uci("e2e4")
+        write_book(
+            self.path,
+            [
+                (chess.Board(), "e2e4", 30),
+                (chess.Board(), "d2d4", 10),
+                (after_e4, "c7c5", 1),
+            ],
+        )
+
+    def tearDown(self):
+        book.close_book()
+        book.book_options["OwnBook"] = False
+        book.book_options["BookBestMove"] = False
+        self.directory.cleanup()
+
+    def test_book_move(self):
+        book.open_book(self.path)
+        # off until OwnBook is set
+        self.assertIsNone(book.book_move(chess.Board()))
+
+        book.book_options["OwnBook"] = True
+        rng = random.Random(0)
+        moves = [book.book_move(chess.Board(), rng) for _ in range(200)]
+        self.assertEqual(set(moves), {chess.Move.from_uci("e2e4"), chess.Move.from_uci("d2d4")})
+        # picked in proportion to weight
+        self.assertGreater(moves.count(chess.Move.from_uci("e2e4")), 120)
+
+        book.book_options["BookBestMove"] = True
+        self.assertEqual(book.book_move(chess.Board()), chess.Move.from_uci("e2e4"))
+
+        # out of book
+        board = chess.Board()
+        board.push_uci("d2d4")
+        self.assertIsNone(book.book_move(board))
+
+    def test_uci_options(self):
+        board = chess.Board()
+        with patch("sys.stdout", new=StringIO()) as patched_output:
+            command(3, board, f"setoption name BookFile value {self.path}")
+            command(3, board, "setoption name OwnBook value true")
+            command(3, board, "position startpos moves e2e4")
+            command(3, board, "go")
+            output = patched_output.getvalue().splitlines()
+        self.assertEqual(output[-1], "bestmove c7c5")
+        self.assertFalse(any(line.startswith("info depth") for line in output))
+
+        command(3, board, "setoption name BookFile value <empty>")
+        self.assertIsNone(book._reader)
@@ -0,0 +1,165 @@
+import chess
+import chess.polyglot
+import random
+import unittest
+from compactboard import CompactBoard, move_uci, to_chess_move
+from evaluate import evaluate_board, check_end_game
+from movegeneration import divide, perft
+
+
+class TestCompactBoard(unittest.TestCase):
+    def test_perft(self):
+        """
+        Test move generation against known move path counts
+        https://www.chessprogramming.org/Perft_Results
+        """
+        for fen, depth, nodes in [
+            (chess.STARTING_FEN, 3, 8902),
+            ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 2, 2039),
+            ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4, 43238),
+            ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 9467),
+            ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 2, 1486),
+        ]:
+            self.assertEqual(perft(CompactBoard(chess.Board(fen)), depth), nodes, fen)
+
+    def test_divide(self):
+        """
+        Test perft by root move agrees with python-chess
+        """
+        board = chess.Board("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        counts = divide(board, 2)
+        self.assertEqual(len(counts), 48)
+        self.assertEqual(sum(nodes for _, nodes in counts), 2039)
+        self.assertEqual(counts, divide(board, 2, compact=False))
+
+    def test_legal_moves(self):
+        """
+        Test the legal moves match python-chess through random games
+        """
+        rng = random.Random(1)
+        for _ in range(20):
+            board = chess.Board()
+            compact = CompactBoard()
+            while not board.is_game_over():
+                self.assertEqual(
+                    sorted(move_uci(move) for move in compact.generate_legal()),
+                    sorted(move.uci() for move in board.legal_moves),
+                    board.fen(),
+                )
+                self.assertEqual(compact.is_check(), board.is_check())
+                move = rng.choice(list(board.legal_moves))
+                self.assertEqual(to_chess_move(compact.from_chess_move(move)), move)
+                board.push(move)
+                compact.push(compact.from_chess_move(move))
+
+    def test_to_board(self):
+        """
+        Test the position converts back to python-chess
+        """
+        rng = random.Random(3)
+        board = chess.Board()
+        compact = CompactBoard()
+        while not board.is_game_over():
+            converted = compact.to_board()
+            self.assertEqual(converted.epd(), board.epd())
+            self.assertEqual(converted.halfmove_clock, board.halfmove_clock)
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            compact.push(compact.from_chess_move(move))
+
+    def test_incremental_evaluation(self):
+        """
+        Test the incrementally maintained evaluation matches a full evaluation
+        through captures, castling, en passant and promotions
+        """
+        rng = random.Random(0)
+        for _ in range(50):
+            board = chess.Board()
+            compact = CompactBoard()
+            while not board.is_game_over() and len(board.move_stack) < 150:
+                move = rng.choice(list(board.legal_moves))
+                board.push(move)
+                compact.push(compact.from_chess_move(move))
+                self.assertEqual(compact.evaluate(), evaluate_board(board), board.fen())
+                self.assertEqual(compact.is_end_game(), check_end_game(board), board.fen())
+            while board.move_stack:
+                board.pop()
+                compact.pop()
+                self.assertEqual(compact.evaluate(), evaluate_board(board), board.fen())
+
+        # built from a game in progress
+        game = chess.Board()
+        for uci in ["e2e4", "d7d5", "e4d5", "g8f6", "f1b5", "c7c6"]:
+            game.push_uci(uci)
+        compact = CompactBoard.from_board(game)
+        self.assertEqual(compact.evaluate(), evaluate_board(game))
+        self.assertEqual(len(compact.keys), len(game.move_stack) + 1)
+
+    def test_incremental_zobrist_key(self):
+        """
+        Test the incrementally maintained key matches a full polyglot hash
+        """
+        rng = random.Random(2)
+        for _ in range(50):
+            board = chess.Board()
+            compact = CompactBoard()
+            while not board.is_game_over() and len(board.move_stack) < 150:
+                move = rng.choice(list(board.legal_moves))
+                board.push(move)
+                compact.push(compact.from_chess_move(move))
+                self.assertEqual(
+                    compact.zobrist_key(), chess.polyglot.zobrist_hash(board), board.fen()
+                )
+            while board.move_stack:
+                board.pop()
+                compact.pop()
+                self.assertEqual(compact.zobrist_key(), chess.polyglot.zobrist_hash(board))
+
+        # passing the turn
+        compact = CompactBoard()
+        compact.push_null()
+        board = chess.Board()
+        board.push(chess.Move.null())
+        self.assertEqual(compact.zobrist_key(), chess.polyglot.zobrist_hash(board))
+        compact.pop()
+        self.assertEqual(compact.zobrist_key(), chess.polyglot.zobrist_hash(chess.Board()))
+
+    def test_repetitions(self):
+        board = CompactBoard()
+        for uci in ["g1f3", "g8f6", "f3g1", "f6g8"]:
+            self.assertFalse(board.is_repetition())
+            board.push(board.parse_uci(uci))
+        self.assertTrue(board.is_repetition())
+
+        # a pawn move means no earlier position can come back
+        board.push(board.parse_uci("e2e4"))
+        for uci in ["g8f6", "g1f3", "f6g8", "f3g1"]:
+            board.push(board.parse_uci(uci))
+        self.assertTrue(board.is_repetition())
+        board.push(board.parse_uci("e7e5"))
+        self.assertFalse(board.is_repetition())
+
+    def test_is_repetition(self):
+        """
+        Test a position from before the root is only a draw when seen twice, but
+        a repeat inside the search is a draw straight away
+        """
+        shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+        game = chess.Board()
+        for uci in shuffle:
+            game.push_uci(uci)
+        board = CompactBoard.from_board(game)
+        self.assertFalse(board.is_repetition())
+        board.push(board.parse_uci("g1f3"))
+        self.assertFalse(board.is_repetition())
+        for uci in shuffle[1:]:
+            board.push(board.parse_uci(uci))
+        # seen twice before, once of them inside the search
+        self.assertTrue(board.is_repetition())
+
+        board = CompactBoard.from_board(game)
+        for uci in shuffle[:2]:
+            board.push(board.parse_uci(uci))
+        # the position after 1. Nf3 Nf6 was only seen once, before the root
+        self.assertFalse(board.is_repetition())
+
@@ -1,21 +1,50 @@
+import multiprocessing
+import time
 import chess
 import unittest
 from io import StringIO
 from unittest.mock import patch
-from communication import command
+import movegeneration
+from bench import BENCH_DEPTH, BENCH_SIGNATURE, time_to_depth
+from communication import command, get_depth_limit, get_go_parameters, get_time_limit, talk
+from compactboard import CompactBoard
+from movegeneration import MAX_DEPTH
+from transposition import ENTRY_SIZE
 
 
 class TestCommunication(unittest.TestCase):
     def test_uci_command(self):
         """
-        Test uci command respond (id name, id author, uciok)
+        Test uci command respond (id name, id author, options, uciok)
         """
         board = chess.Board()
         with patch("sys.stdout", new=StringIO()) as patched_output:
             command(3, board, "uci")
             lines = patched_output.getvalue().strip().split("\n")
-            self.assertEqual(len(lines), 3)
-            self.assertEqual(lines[2], "uciok")
+            self.assertTrue(lines[0].startswith("id name"))
+            self.assertTrue(lines[1].startswith("id author"))
+            self.assertIn("option name Hash type spin default 16 min 1 max 1024", lines)
+            self.assertEqual(lines[-1], "uciok")
+
+    def test_hash_option_and_ucinewgame(self):
+        """
+        Test the transposition table can be resized and is cleared between games
+        """
+        board = chess.Board()
+        command(3, board, "setoption name Hash value 1")
+        self.assertEqual(
+            movegeneration.transposition_table.size, 1024 * 1024 // ENTRY_SIZE
+        )
+
+        with patch("sys.stdout", new=StringIO()):
+            command(3, board, "position startpos moves e2e4")
+            command(3, board, "go")
+        key = CompactBoard.from_board(board).zobrist_key()
+        self.assertIsNotNone(movegeneration.transposition_table.probe(key))
+
+        command(3, board, "ucinewgame")
+        self.assertIsNone(movegeneration.transposition_table.probe(key))
+        command(3, board, "setoption name Hash value 16")
 
     def test_position_startpos_command(self):
         """
@@ -65,6 +94,32 @@ class TestCommunication(unittest.TestCase):
             board.fen(), "rnbqkbnr/pp2pp1p/3p2p1/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 0 5"
         )
 
+    def test_incremental_position_command(self):
+        """
+        Test a position continuing the last one gives the same board as setting it up from scratch
+        """
+        board = chess.Board()
+        game = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"]
+        for plies in [1, 2, 4, 6, 3, 5, 0, 6]:
+            command(3, board, "position startpos moves " + " ".join(game[:plies]))
+            expected = chess.Board()
+            for move in game[:plies]:
+                expected.push_uci(move)
+            self.assertEqual(board.fen(), expected.fen())
+            self.assertEqual(board.move_stack, expected.move_stack)
+
+        # a different game from the same root
+        command(3, board, "position startpos moves d2d4 d7d5")
+        self.assertEqual(
+            board.fen(), "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2"
+        )
+        # a new board
+        board = chess.Board()
+        command(3, board, "position startpos moves d2d4 d7d5 c2c4")
+        self.assertEqual(
+            board.fen(), "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2"
+        )
+
     def test_go_command_black(self):
         """
         Test go command with Andoma playing with black pieces
@@ -79,7 +134,7 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # black bishop should take a undefended rook
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove d4b6")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove d4b6")
 
         board = chess.Board()
         with patch("sys.stdout", new=StringIO()) as patched_output:
@@ -91,7 +146,7 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # black will trade a bishop for a queen
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove g7c3")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove g7c3")
 
         board = chess.Board()
         with patch("sys.stdout", new=StringIO()) as patched_output:
@@ -103,7 +158,7 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # black will threaten a bishop with a pawn (a very strong but not instantly obvious move)
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove c5c4")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove c5c4")
 
     def test_go_command_white(self):
         """
@@ -117,7 +172,7 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # white bishop should take a undefended rook
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove b3g8")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove b3g8")
 
         board = chess.Board()
         with patch("sys.stdout", new=StringIO()) as patched_output:
@@ -129,7 +184,7 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # white will trade a bishop for a queen
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove b2g7")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove b2g7")
 
         board = chess.Board()
         with patch("sys.stdout", new=StringIO()) as patched_output:
@@ -141,7 +196,314 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # white will threaten a bishop with a pawn (a very strong but not instantly obvious move)
-            self.assertEqual(patched_output.getvalue().splitlines()[1], "bestmove f4f5")
+            self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove f4f5")
+
+    def test_search_options(self):
+        """
+        Test null-move pruning and late move reductions can be switched off and on
+        """
+        board = chess.Board()
+        command(3, board, "setoption name NullMove value false")
+        command(3, board, "setoption name LMR value false")
+        self.assertEqual(movegeneration.search_options, {"NullMove": False, "LMR": False})
+
+        with patch("sys.stdout", new=StringIO()):
+            command(3, board, "position fen 8/5pk1/6p1/8/3R4/6P1/5PK1/8 w - - 0 1")
+            # both only kick in from depth 3 below the root
+            command(4, board, "go")
+            nodes = movegeneration.debug_info["nodes"]
+            command(4, board, "setoption name NullMove value true")
+            command(4, board, "setoption name LMR value true")
+            command(4, board, "ucinewgame")
+            command(4, board, "go")
+        self.assertEqual(movegeneration.search_options, {"NullMove": True, "LMR": True})
+        self.assertLess(movegeneration.debug_info["nodes"], nodes)
+
+    def test_threads_option(self):
+        """
+        Test searching the root moves with worker processes
+        """
+        board = chess.Board()
+        try:
+            command(3, board, "setoption name Threads value 2")
+            self.assertIsNotNone(movegeneration._pool)
+            with patch("sys.stdout", new=StringIO()) as patched_output:
+                command(
+                    3,
+                    board,
+                    "position fen 3r4/8/1R4pk/1P3p1p/3bn2P/3R2P1/6K1/3B4 b - - 0 1",
+                )
+                command(3, board, "go")
+                # black bishop should take a undefended rook
+                self.assertEqual(patched_output.getvalue().splitlines()[-1], "bestmove d4b6")
+                # the workers share the node budget, and their counters are added up
+                command(3, board, "ucinewgame")
+                command(3, board, "position startpos moves e2e4 e7e5 g1f3")
+                command(3, board, "go nodes 3000")
+            self.assertLess(movegeneration.debug_info["nodes"], 3000 + 256 * 3)
+            self.assertGreater(movegeneration.debug_info["tt_hits"], 0)
+        finally:
+            command(3, board, "setoption name Threads value 1")
+        self.assertIsNone(movegeneration._pool)
+
+    def test_worker_hash(self):
+        """
+        Test a worker sizes its transposition table by the Hash option it is sent
+        """
+        syzygy = {"SyzygyPath": "", "SyzygyProbeLimit": 7}
+        task = (chess.STARTING_FEN, [], "e2e4", 2, movegeneration.INFINITY, None, -1, -1, None, 1, syzygy)
+        shared_alpha = multiprocessing.Value("q", -movegeneration.INFINITY)
+        with patch.multiple(movegeneration, _shared_alpha=shared_alpha, _game_id=0, _search_id=0):
+            try:
+                uci, score, counters, _ = movegeneration.search_root_move(task)
+                self.assertEqual(uci, "e2e4")
+                self.assertIsNotNone(score)
+                self.assertGreater(counters["nodes"], 0)
+                self.assertEqual(movegeneration.transposition_table.size_mb, 1)
+            finally:
+                movegeneration.transposition_table.resize(16)
+                movegeneration.new_game()
+
+    def test_worker_node_limit(self):
+        """
+        Test a worker stops once the workers together have spent the node budget
+        """
+        syzygy = {"SyzygyPath": "", "SyzygyProbeLimit": 7}
+        task = (chess.STARTING_FEN, [], "e2e4", 8, movegeneration.INFINITY, float("inf"), -1, -1, 2000, 16, syzygy)
+        shared_alpha = multiprocessing.Value("q", -movegeneration.INFINITY)
+        # another worker has already searched 1000 nodes
+        shared_nodes = multiprocessing.Value("q", 1000)
+        with patch.multiple(
+            movegeneration, _shared_alpha=shared_alpha, _shared_nodes=shared_nodes, _game_id=0, _search_id=0
+        ):
+            try:
+                _, score, counters, _ = movegeneration.search_root_move(task)
+                self.assertIsNone(score)
+                self.assertLess(counters["nodes"], 1000 + 256)
+                self.assertGreaterEqual(shared_nodes.value, 2000)
+                self.assertIsNone(movegeneration._node_limit)
+            finally:
+                movegeneration.new_game()
+
+    def test_go_time_limit(self):
+        """
+        Test the time budget derived from go parameters
+        """
+        params = get_go_parameters("go wtime 60000 btime 30000 winc 1000 binc 0".split())
+        self.assertEqual(
+            params, {"wtime": 60000, "btime": 30000, "winc": 1000, "binc": 0}
+        )
+        self.assertEqual(get_time_limit(params, chess.WHITE), 2.75)
+        self.assertEqual(get_time_limit(params, chess.BLACK), 1)
+
+        params = get_go_parameters("go btime 1000 movestogo 1".split())
+        self.assertEqual(get_time_limit(params, chess.BLACK), 0.95)
+
+        self.assertEqual(get_time_limit(get_go_parameters(["go", "movetime", "500"]), chess.WHITE), 0.45)
+        self.assertIsNone(get_time_limit(get_go_parameters(["go"]), chess.WHITE))
+        self.assertIsNone(get_time_limit(get_go_parameters(["go", "infinite"]), chess.WHITE))
+
+    def test_go_movetime(self):
+        """
+        Test the engine answers within its time budget
+        """
+        board = chess.Board()
+        with patch("sys.stdout", new=StringIO()) as patched_output:
+            command(3, board, "position startpos moves e2e4 e7e5 g1f3 b8c6")
+            t0 = time.time()
+            command(3, board, "go movetime 300")
+            self.assertLess(time.time() - t0, 1)
+
+            bestmove = patched_output.getvalue().splitlines()[-1].split(" ")[1]
+            self.assertIn(chess.Move.from_uci(bestmove), board.legal_moves)
+
+    def test_go_depth(self):
+        """
+        Test `go depth N` searches to that depth, whatever the engine's default
+        """
+        board = chess.Board()
+        with patch("sys.stdout", new=StringIO()) as patched_output:
+            command(3, board, "position startpos moves e2e4 e7e5")
+            command(3, board, "go depth 2")
+        lines = patched_output.getvalue().splitlines()
+        self.assertTrue(lines[-3].startswith("info depth 2 "))
+        stats = lines[-2].split()
+        self.assertEqual(stats[:2], ["info", "string"])
+        for name in ["tt_hits", "tt_misses", "null_move_cutoffs", "aspiration_researches", "ebf"]:
+            self.assertIn(name, stats)
+        self.assertEqual(movegeneration.debug_info["depth"], 2)
+        self.assertEqual(get_depth_limit(get_go_parameters(["go", "depth", "999"]), 3, None), MAX_DEPTH)
+        self.assertEqual(get_depth_limit(get_go_parameters(["go", "nodes", "10"]), 3, None), MAX_DEPTH)
+        self.assertEqual(get_depth_limit(get_go_parameters(["go"]), 3, None), 3)
+
+    def test_go_nodes(self):
+        """
+        Test `go nodes N` stops soon after N nodes, with the same result every time
+        """
+        board = chess.Board()
+        results = []
+        for _ in range(2):
+            movegeneration.new_game()
+            with patch("sys.stdout", new=StringIO()) as patched_output:
+                command(3, board, "position startpos moves e2e4 e7e5 g1f3")
+                command(3, board, "go nodes 3000")
+            nodes = movegeneration.debug_info["nodes"]
+            self.assertLess(nodes, 3000 + 256)
+            results.append((patched_output.getvalue().splitlines()[-1], nodes))
+        self.assertEqual(results[0], results[1])
+
+    def test_stop(self):
+        """
+        Test the engine keeps answering while it searches, and answers `go infinite` on `stop`
+        """
+        lines = iter(["position startpos moves e2e4", "go infinite", "isready", "stop", "quit"])
+
+        def slow_input():
+            time.sleep(0.2)
+            return next(lines)
+
+        with patch("sys.stdout", new=StringIO()) as patched_output, patch(
+            "communication.input", side_effect=slow_input
+        ), patch("communication.get_depth", return_value=3):
+            t0 = time.time()
+            with self.assertRaises(SystemExit):
+                talk()
+            self.assertLess(time.time() - t0, 5)
+
+            output = patched_output.getvalue().splitlines()
+            self.assertIn("readyok", output)
+            bestmove = output[-1].split(" ")
+            self.assertEqual(bestmove[0], "bestmove")
+            self.assertLess(output.index("readyok"), len(output) - 1)
+            board = chess.Board()
+            board.push_uci("e2e4")
+            self.assertIn(chess.Move.from_uci(bestmove[1]), board.legal_moves)
+
+    def test_search_error(self):
+        """
+        Test an error on the search thread is reported, with a move when one was asked for
+        """
+        lines = iter(["position startpos", "go perft x", "go depth 2", "quit"])
+
+        def slow_input():
+            time.sleep(0.2)
+            return next(lines)
+
+        with patch("sys.stdout", new=StringIO()) as patched_output, patch(
+            "communication.input", side_effect=slow_input
+        ), patch("communication.get_depth", return_value=3), patch(
+            "communication.next_move", side_effect=RuntimeError("search failed")
+        ):
+            with self.assertRaises(SystemExit):
+                talk()
+        output = patched_output.getvalue().splitlines()
+        self.assertEqual(output[0], "info string ValueError: invalid literal for int() with base 10: 'x'")
+        self.assertEqual(output[1], "info string RuntimeError: search failed")
+        self.assertEqual(output[2].split()[0], "bestmove")
+        self.assertIn(chess.Move.from_uci(output[2].split()[1]), chess.Board().legal_moves)
+
+    def test_ponder(self):
+        """
+        Test `go ponder` only answers after `ponderhit` or `stop`, with a move to ponder on
+        """
+        moves = "position startpos moves e2e4 e7e5 g1f3"
+        for end in ["ponderhit", "stop"]:
+            lines = iter(
+                [
+                    "setoption name Ponder value true",
+                    moves,
+                    "go ponder wtime 1000 btime 1000",
+                    "isready",
+                    end,
+                    "quit",
+                ]
+            )
+
+            def slow_input():
+                time.sleep(0.3)
+                return next(lines)
+
+            with patch("sys.stdout", new=StringIO()) as patched_output, patch(
+                "communication.input", side_effect=slow_input
+            ), patch("communication.get_depth", return_value=3):
+                with self.assertRaises(SystemExit):
+                    talk()
+                output = patched_output.getvalue().splitlines()
+                answers = [line for line in output if line.startswith("bestmove")]
+                self.assertEqual(len(answers), 1)
+                self.assertLess(output.index("readyok"), output.index(answers[0]))
+
+                _, bestmove, _, reply = answers[0].split(" ")
+                board = chess.Board()
+                for move in moves.split(" ")[3:]:
+                    board.push_uci(move)
+                board.push_uci(bestmove)
+                self.assertIn(chess.Move.from_uci(reply), board.legal_moves)
+        command(3, chess.Board(), "setoption name Ponder value false")
+
+    def test_info_lines(self):
+        """
+        Test every completed iteration is reported with a UCI info line and a legal principal variation
+        """
+        board = chess.Board()
+        with patch("sys.stdout", new=StringIO()) as patched_output:
+            command(3, board, "position startpos moves e2e4 e7e5")
+            command(3, board, "go")
+            output = patched_output.getvalue().splitlines()
+        info = [line.split(" ") for line in output if line.startswith("info depth")]
+        self.assertEqual([tokens[2] for tokens in info], ["1", "2", "3"])
+        for tokens in info:
+            for field in ["seldepth", "score", "nodes", "nps", "time", "hashfull", "pv"]:
+                self.assertIn(field, tokens)
+            self.assertIn(tokens[tokens.index("score") + 1], ["cp", "mate"])
+
+        pv = info[-1][info[-1].index("pv") + 1 :]
+        self.assertEqual(output[-1], f"bestmove {pv[0]}")
+        for move in pv:
+            self.assertIn(chess.Move.from_uci(move), board.legal_moves)
+            board.push_uci(move)
+
+    def test_uci_score(self):
+        self.assertEqual(movegeneration.uci_score(35), "cp 35")
+        self.assertEqual(movegeneration.uci_score(-35), "cp -35")
+        # mate in two (three plies), getting mated in one (two plies)
+        self.assertEqual(movegeneration.uci_score(movegeneration.MATE_SCORE - 3), "mate 2")
+        self.assertEqual(movegeneration.uci_score(-movegeneration.MATE_SCORE + 2), "mate -1")
+
+    def test_bench(self):
+        """
+        Test the bench command reports the same nodes every time
+        """
+        signatures = []
+        for _ in range(2):
+            with patch("sys.stdout", new=StringIO()) as patched_output:
+                command(3, chess.Board(), "bench 2")
+                lines = patched_output.getvalue().splitlines()
+            self.assertTrue(lines[-3].startswith("Total time (ms) : "))
+            self.assertTrue(lines[-1].startswith("Nodes/second    : "))
+            signatures.append(int(lines[-2].split(":")[1]))
+        self.assertGreater(signatures[0], 0)
+        self.assertEqual(signatures[0], signatures[1])
+
+    def test_bench_signature(self):
+        """
+        Test the bench nodes match BENCH_SIGNATURE: update it when the search is meant to change
+        """
+        _, nodes = time_to_depth(BENCH_DEPTH)
+        self.assertEqual(nodes, BENCH_SIGNATURE)
+
+    def test_perft(self):
+        """
+        Test perft counts move paths by root move, on either board
+        """
+        for perft in ["go perft 3", "perft 3 python-chess"]:
+            with patch("sys.stdout", new=StringIO()) as patched_output:
+                command(3, chess.Board(), perft)
+                lines = patched_output.getvalue().splitlines()
+            self.assertEqual(len(lines), 20 + 3)
+            self.assertEqual(lines[0], "a2a3: 380")
+            self.assertEqual(lines[-2], "Nodes searched: 8902")
+            self.assertTrue(lines[-1].startswith("Nodes/second: "))
 
     def test_draw(self):
         """
@@ -157,4 +519,4 @@ class TestCommunication(unittest.TestCase):
             command(3, board, "go")
 
             # bot is in a favorable position, should avoid threefold repetition
-            self.assertNotEqual(patched_output.getvalue().splitlines()[1], "bestmove c6a8")
+            self.assertNotEqual(patched_output.getvalue().splitlines()[-1], "bestmove c6a8")
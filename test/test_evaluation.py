@@ -1,6 +1,84 @@
 import chess
+import random
 import unittest
-from evaluate import evaluate_board, move_value, check_end_game
+from evaluate import (
+    evaluate_board,
+    evaluate_piece,
+    move_value,
+    check_end_game,
+    piece_value,
+    pawnEvalWhite,
+    pawnEvalBlack,
+    knightEval,
+    bishopEvalWhite,
+    bishopEvalBlack,
+    rookEvalWhite,
+    rookEvalBlack,
+    queenEval,
+    kingEvalWhite,
+    kingEvalBlack,
+    kingEvalEndGameWhite,
+    kingEvalEndGameBlack,
+)
+
+FEN_CORPUS = [
+    chess.STARTING_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r2qkb1r/pppn1pp1/2n1b2p/4p3/3pPP2/3P2P1/PPPBN1BP/R2QK1NR w KQkq - 0 1",
+    "rn1qk2r/pb1nbppp/1p2p3/2ppP3/3P4/P2B1N2/1PP1NPPP/R1BQ1RK1 b kq - 0 1",
+    "r2qk2r/pb4pp/1n2Pb2/2B2Q2/p1p5/2P5/2B2PPP/RN2R1K1 w - - 1 0",
+    "3r4/8/1R4pk/1P3p1p/3bn2P/3R2P1/6K1/3B4 b - - 0 1",
+    "3k3q/3p4/8/8/8/8/4P3/Q3K3 w - - 0 1",
+    "rnb1kbnr/ppp1pppp/8/8/8/8/PPP1PPPP/RNB1KBNR w KQkq - 0 1",
+    "8/4P3/2k5/8/8/3K4/8/8 w - - 0 1",
+    "6k1/8/8/5r2/8/8/4r3/2K5 b - - 1 1",
+    "8/8/8/8/8/8/8/K6k w - - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+]
+
+
+def reference_evaluate_piece(piece: chess.Piece, square: chess.Square, end_game: bool) -> int:
+    """
+    The original piece-square lookup, straight from the per-piece tables.
+    """
+    white = piece.color == chess.WHITE
+    mapping = {
+        chess.PAWN: pawnEvalWhite if white else pawnEvalBlack,
+        chess.KNIGHT: knightEval,
+        chess.BISHOP: bishopEvalWhite if white else bishopEvalBlack,
+        chess.ROOK: rookEvalWhite if white else rookEvalBlack,
+        chess.QUEEN: queenEval,
+    }.get(piece.piece_type)
+    if mapping is None:
+        if end_game:
+            mapping = kingEvalEndGameWhite if white else kingEvalEndGameBlack
+        else:
+            mapping = kingEvalWhite if white else kingEvalBlack
+    return mapping[square]
+
+
+def reference_evaluate_board(board: chess.Board) -> float:
+    """
+    The original square-by-square evaluation.
+    """
+    pieces = [board.piece_at(square) for square in chess.SQUARES]
+    queens = sum(1 for piece in pieces if piece and piece.piece_type == chess.QUEEN)
+    minors = sum(
+        1
+        for piece in pieces
+        if piece and piece.piece_type in (chess.BISHOP, chess.KNIGHT)
+    )
+    end_game = queens == 0 or (queens == 2 and minors <= 1)
+
+    total = 0
+    for square, piece in zip(chess.SQUARES, pieces):
+        if not piece:
+            continue
+        value = piece_value[piece.piece_type] + reference_evaluate_piece(piece, square, end_game)
+        total += value if piece.color == chess.WHITE else -value
+    return total
 
 
 class TestEvaluation(unittest.TestCase):
@@ -136,3 +214,35 @@ class TestEvaluation(unittest.TestCase):
         self.assertTrue(
             evaluate_board(black_played_b8c6) < evaluate_board(white_played_e2e4)
         )
+
+    def test_bitboard_evaluation_matches_reference(self):
+        """
+        Test the bitboard evaluation gives the same scores as a scan of every square
+        """
+        rng = random.Random(1)
+        for fen in FEN_CORPUS:
+            board = chess.Board(fen)
+            self.assertEqual(evaluate_board(board), reference_evaluate_board(board), fen)
+            # a few plies of random play from every position
+            for _ in range(20):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+                self.assertEqual(
+                    evaluate_board(board), reference_evaluate_board(board), board.fen()
+                )
+
+    def test_piece_square_table_matches_reference(self):
+        """
+        Test every piece on every square, in both phases, is looked up as in the per-piece tables
+        """
+        for end_game in (False, True):
+            for color in chess.COLORS:
+                for piece_type in chess.PIECE_TYPES:
+                    piece = chess.Piece(piece_type, color)
+                    for square in chess.SQUARES:
+                        self.assertEqual(
+                            evaluate_piece(piece, square, end_game),
+                            reference_evaluate_piece(piece, square, end_game),
+                        )
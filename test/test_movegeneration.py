@@ -0,0 +1,148 @@
+import chess
+import random
+import unittest
+import movegeneration
+from compactboard import CompactBoard, NULL_MOVE, move_uci
+from movegeneration import (
+    HISTORY_MASK,
+    age_move_ordering,
+    aspiration_search,
+    expected_reply,
+    get_capture_moves,
+    get_ordered_moves,
+    is_legal,
+    negamax_root,
+    new_game,
+    next_move,
+    record_cutoff,
+)
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_capture_moves_order(self):
+        """
+        Test captures are ordered most valuable victim first, then least valuable aggressor
+        """
+        board = CompactBoard(chess.Board("4k3/8/8/2q1b3/3P4/QN6/8/4K3 w - - 0 1"))
+        moves = [move_uci(move) for move in get_capture_moves(board)]
+        self.assertEqual(moves, ["d4c5", "b3c5", "a3c5", "d4e5"])
+
+    def test_ordered_moves_stages(self):
+        """
+        Test the hash move comes first, then captures, killers and quiet moves,
+        with losing captures last
+        """
+        # Nxd5 and Qxd5 lose a piece to exd5
+        board = CompactBoard(chess.Board("4k3/8/4p3/3p4/r7/2N5/8/3QK3 w - - 0 1"))
+        hash_move = board.parse_uci("e1e2")
+        killer = board.parse_uci("e1f2")
+        moves = [move_uci(move) for move in get_ordered_moves(board, hash_move, [killer])]
+
+        self.assertEqual(moves[:4], ["e1e2", "c3a4", "d1a4", "e1f2"])
+        self.assertEqual(set(moves[-2:]), {"c3d5", "d1d5"})
+
+    def test_ordered_moves_are_the_legal_moves(self):
+        """
+        Test every legal move is generated exactly once
+        """
+        rng = random.Random(0)
+        board = chess.Board(
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+        )
+        while not board.is_game_over() and len(board.move_stack) < 100:
+            compact = CompactBoard.from_board(board)
+            legal_moves = compact.generate_legal()
+            # stale hash and killer moves must not be played
+            hash_move = rng.choice(legal_moves + [compact.parse_uci("a1a8")])
+            killers = [rng.choice(legal_moves), compact.parse_uci("h1h8")]
+            moves = [
+                move
+                for move in get_ordered_moves(compact, hash_move, killers)
+                if is_legal(compact, move)
+            ]
+            self.assertEqual(len(moves), len(legal_moves))
+            self.assertEqual(set(moves), set(legal_moves))
+            board.push(rng.choice(list(board.legal_moves)))
+
+
+class TestKillersAndHistory(unittest.TestCase):
+    def tearDown(self):
+        new_game()
+
+    def test_record_cutoff(self):
+        """
+        Test quiet moves that cause a cutoff become killers and gain history
+        """
+        new_game()
+        board = CompactBoard(chess.Board("4k3/8/4p3/3p4/8/2N5/8/3QK3 w - - 0 1"))
+        quiet = board.parse_uci("c3b5")
+        capture = board.parse_uci("c3d5")
+        index = quiet & HISTORY_MASK
+
+        record_cutoff(board, quiet, 3, 2)
+        record_cutoff(board, capture, 3, 2)
+        self.assertEqual(movegeneration.killer_moves[2], [quiet])
+        self.assertEqual(movegeneration.history[chess.WHITE][index], 9)
+        self.assertEqual(movegeneration.history[chess.BLACK][index], 0)
+
+        # the killer is tried first, as neither capture wins material
+        moves = list(get_ordered_moves(board, killers=movegeneration.killer_moves[2]))
+        self.assertEqual(moves[0], quiet)
+
+        # only the most recent killers are kept
+        for uci in ["e1e2", "e1f2", "e1f1"]:
+            record_cutoff(board, board.parse_uci(uci), 3, 2)
+        self.assertEqual(
+            movegeneration.killer_moves[2],
+            [board.parse_uci("e1f1"), board.parse_uci("e1f2")],
+        )
+
+        age_move_ordering()
+        self.assertEqual(movegeneration.killer_moves[2], [])
+        self.assertEqual(movegeneration.history[chess.WHITE][index], 1)
+
+        record_cutoff(board, quiet, 3, 2)
+        new_game()
+        self.assertEqual(movegeneration.killer_moves[2], [])
+        self.assertEqual(movegeneration.history[chess.WHITE][index], 0)
+
+    def test_effective_branching_factor(self):
+        """
+        Test the effective branching factor of the search is reported
+        """
+        next_move(3, chess.Board(), debug=False)
+        self.assertGreater(movegeneration.debug_info["ebf"], 1)
+
+    def test_aspiration_windows(self):
+        """
+        Test a search in a window around a wrong guess still finds the full-window score
+        (without the pruning that makes scores depend on the window)
+        """
+        movegeneration.search_options.update(NullMove=False, LMR=False)
+        self.addCleanup(movegeneration.search_options.update, NullMove=True, LMR=True)
+        fen = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+        movegeneration.debug_info.update(nodes=0, seldepth=0, tt_hits=0, tt_misses=0, tb_hits=0)
+        new_game()
+        move, score = negamax_root(3, CompactBoard(chess.Board(fen)))
+        for guess in [score, score - 500, score + 2000]:
+            new_game()
+            self.assertEqual(aspiration_search(3, CompactBoard(chess.Board(fen)), NULL_MOVE, guess), (move, score))
+
+        # a window the score is outside of only bounds it
+        new_game()
+        _, bound = negamax_root(3, CompactBoard(chess.Board(fen)), NULL_MOVE, score + 100, score + 200)
+        self.assertLessEqual(bound, score + 100)
+
+    def test_full_principal_variation(self):
+        """
+        Test the PV reaches the search depth, with transposition table hits along it
+        """
+        board = chess.Board()
+        board.push_uci("e2e4")
+        board.push_uci("e7e5")
+        new_game()
+        move = next_move(4, board, debug=False)
+        pv = movegeneration.debug_info["pv"]
+        self.assertEqual(len(pv), 4)
+        self.assertEqual(pv[0], move.uci())
+        self.assertEqual(expected_reply(board, move), chess.Move.from_uci(pv[1]))
@@ -1,6 +1,7 @@
 import chess
 import unittest
-from movegeneration import next_move
+import movegeneration
+from movegeneration import next_move, MATE_SCORE
 
 
 class TestPuzzles(unittest.TestCase):
@@ -12,9 +13,18 @@ class TestPuzzles(unittest.TestCase):
         )
         move = next_move(3, board)
         self.assertEqual(move.uci(), "f5g6")
+        # mate on the third ply
+        self.assertEqual(movegeneration.debug_info["score"], MATE_SCORE - 3)
 
     def test_mate_in_one(self):
         # Multiple mate in 2s/3s, but only one mate in 1
         board = chess.Board("6k1/8/8/5r2/8/8/4r3/2K5 b - - 1 1")
         move = next_move(3, board)
         self.assertEqual(move.uci(), "f5f1")
+        self.assertEqual(movegeneration.debug_info["score"], MATE_SCORE - 1)
+
+    def test_quiescence_sees_recapture(self):
+        # At depth 1 taking the pawn looks good, until black recaptures the queen
+        board = chess.Board("4k3/8/4p3/3p4/8/8/8/3QK3 w - - 0 1")
+        move = next_move(1, board, debug=False)
+        self.assertNotEqual(move.uci(), "d1d5")
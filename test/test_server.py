@@ -0,0 +1,160 @@
+import asyncio
+import chess
+import json
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from server import Server, serve
+
+
+async def send(writer: asyncio.StreamWriter, *lines: str):
+    for line in lines:
+        writer.write((line + "\n").encode())
+    await writer.drain()
+
+
+async def read_until(reader: asyncio.StreamReader, prefix: str):
+    """
+    The lines read up to and including the first starting with `prefix`.
+    """
+    lines = []
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), 30)).decode().strip()
+        lines.append(line)
+        if line.startswith(prefix):
+            return lines
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(workers=2, max_sessions=4, depth=2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def run_with_server(self, client):
+        async def run():
+            listener = await serve(self.server)
+            port = listener.sockets[0].getsockname()[1]
+            try:
+                await client(port)
+                # Let the sessions see their clients have gone
+                while self.server.sessions:
+                    await asyncio.sleep(0.01)
+            finally:
+                listener.close()
+                await listener.wait_closed()
+
+        asyncio.run(run())
+
+    def test_concurrent_sessions(self):
+        """
+        Test sessions keep their own positions while searching at the same time
+        """
+        fens = [
+            "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+            "r2qkb1r/pppn1pp1/2n1b2p/4p3/3pPP2/3P2P1/PPPBN1BP/R2QK1NR w KQkq - 0 1",
+        ]
+
+        async def client(port):
+            connections = [await asyncio.open_connection("127.0.0.1", port) for _ in fens]
+            for (reader, writer), fen in zip(connections, fens):
+                await send(writer, "uci")
+                self.assertEqual((await read_until(reader, "uciok"))[0], "id name Andoma")
+                await send(writer, f"position fen {fen}", "go")
+            for (reader, writer), fen in zip(connections, fens):
+                lines = await read_until(reader, "bestmove")
+                move = chess.Move.from_uci(lines[-1].split()[1])
+                self.assertIn(move, chess.Board(fen).legal_moves)
+                self.assertTrue(lines[-2].startswith("info depth 2"))
+
+            reader, writer = connections[0]
+            await send(writer, "metrics")
+            metrics = json.loads((await read_until(reader, "info string"))[-1][len("info string "):])
+            self.assertEqual(metrics["sessions"], 3)
+            self.assertEqual(metrics["queue_depth"], 0)
+            self.assertEqual([latency["searches"] for latency in metrics["latency_ms"].values()], [1, 1, 1])
+            for _, writer in connections:
+                await send(writer, "quit")
+                writer.close()
+
+        self.run_with_server(client)
+
+    def test_stop(self):
+        """
+        Test an infinite search answers on stop, and isready is answered while it runs
+        """
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await send(writer, "position startpos moves e2e4", "go infinite", "isready")
+            self.assertEqual(await read_until(reader, "readyok"), ["readyok"])
+            await asyncio.sleep(0.5)
+            await send(writer, "stop")
+            lines = await read_until(reader, "bestmove")
+            board = chess.Board()
+            board.push_uci("e2e4")
+            self.assertIn(chess.Move.from_uci(lines[-1].split()[1]), board.legal_moves)
+            writer.close()
+
+        self.run_with_server(client)
+
+    def test_too_many_sessions(self):
+        async def client(port):
+            connections = [await asyncio.open_connection("127.0.0.1", port) for _ in range(4)]
+            for reader, writer in connections:
+                await send(writer, "isready")
+                await read_until(reader, "readyok")
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            self.assertEqual(await read_until(reader, "info string"), ["info string too many sessions"])
+            writer.close()
+            for _, writer in connections:
+                writer.close()
+
+        self.run_with_server(client)
+
+    def test_bad_command(self):
+        """
+        Test an illegal move or option value is reported, and the session carries on
+        """
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await send(writer, "position startpos moves e2e5", "isready")
+            lines = await read_until(reader, "readyok")
+            self.assertTrue(lines[0].startswith("info string"))
+            self.assertEqual(lines[-1], "readyok")
+            await send(writer, "setoption name Hash value x", "isready")
+            lines = await read_until(reader, "readyok")
+            self.assertTrue(lines[0].startswith("info string"))
+            await send(writer, "position startpos moves e2e4", "go depth 1")
+            lines = await read_until(reader, "bestmove")
+            board = chess.Board()
+            board.push_uci("e2e4")
+            self.assertIn(chess.Move.from_uci(lines[-1].split()[1]), board.legal_moves)
+            writer.close()
+
+        self.run_with_server(client)
+
+    def test_search_error(self):
+        """
+        Test a search that fails still gets a bestmove, and is counted
+        """
+
+        async def fail(session, task):
+            raise RuntimeError("worker died")
+
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            await send(writer, "position startpos", "go")
+            lines = await read_until(reader, "bestmove")
+            self.assertEqual(lines[0], "info string RuntimeError: worker died")
+            self.assertIn(chess.Move.from_uci(lines[-1].split()[1]), chess.Board().legal_moves)
+            await send(writer, "metrics")
+            metrics = json.loads((await read_until(reader, "info string"))[-1][len("info string "):])
+            self.assertEqual(metrics["search_errors"], 1)
+            writer.close()
+
+        with patch.object(self.server, "run_search", fail), patch("sys.stderr", new=StringIO()):
+            self.run_with_server(client)
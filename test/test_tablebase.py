@@ -0,0 +1,129 @@
+import chess
+import unittest
+from io import StringIO
+from unittest.mock import patch
+import movegeneration
+import tablebase
+from communication import command
+from compactboard import CompactBoard
+from movegeneration import next_move
+
+
+class StubTablebase:
+    """
+    Stands in for chess.syzygy.Tablebase: positions with at most `pieces` pieces
+    are drawn, unless listed in `wdl` (by board FEN, from the side to move's view).
+    """
+
+    def __init__(self, wdl=None, dtz=None, pieces=4):
+        self.wdl = wdl or {}
+        self.dtz = dtz or {}
+        self.pieces = pieces
+        self.probes = 0
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        self.probes += 1
+        if chess.popcount(board.occupied) > self.pieces:
+            raise chess.syzygy.MissingTableError()
+        return self.wdl.get(board.board_fen(), 0)
+
+    def probe_dtz(self, board: chess.Board) -> int:
+        if chess.popcount(board.occupied) > self.pieces:
+            raise chess.syzygy.MissingTableError()
+        return self.dtz.get(board.board_fen(), self.wdl.get(board.board_fen(), 0))
+
+    def close(self):
+        pass
+
+
+def child_fen(fen: str, uci: str) -> str:
+    board = chess.Board(fen)
+    board.push_uci(uci)
+    return board.board_fen()
+
+
+class TestTablebase(unittest.TestCase):
+    def use(self, stub: StubTablebase):
+        tablebase._tablebase = stub
+        tablebase._max_pieces = stub.pieces
+
+    def tearDown(self):
+        tablebase.close_tablebase()
+        tablebase.syzygy_options["SyzygyProbeLimit"] = 7
+        movegeneration.new_game()
+
+    def test_winning_root_move(self):
+        """
+        Test a won ending plays the winning move that makes progress soonest
+        """
+        fen = "8/8/8/4k3/8/8/8/KQ6 w - - 0 1"
+        # after any move black (to move) is lost; Qb5+ gets there fastest
+        board = chess.Board(fen)
+        wdl = {}
+        dtz = {}
+        for move in board.legal_moves:
+            wdl[child_fen(fen, move.uci())] = -2
+            dtz[child_fen(fen, move.uci())] = -20
+        dtz[child_fen(fen, "b1b5")] = -5
+        self.use(StubTablebase(wdl, dtz))
+
+        self.assertEqual(next_move(3, board, debug=False), chess.Move.from_uci("b1b5"))
+        self.assertEqual(movegeneration.debug_info["tb_hits"], 1)
+        self.assertEqual(movegeneration.debug_info["score"], tablebase.TB_WIN_SCORE - 1)
+
+        # too many pieces for the probe limit: searched as usual
+        tablebase.syzygy_options["SyzygyProbeLimit"] = 2
+        self.assertIsNone(tablebase.root_moves(board))
+
+    def test_drawing_root_moves(self):
+        """
+        Test a drawn ending is searched among the moves that keep the draw
+        """
+        fen = "4k3/8/8/8/q7/8/8/3QK3 w - - 0 1"
+        board = chess.Board(fen)
+        # the search would take the queen, but the stub says that loses
+        self.assertEqual(next_move(2, board, debug=False), chess.Move.from_uci("d1a4"))
+        self.use(StubTablebase({child_fen(fen, "d1a4"): 2}))
+        movegeneration.new_game()
+
+        move = next_move(2, board, debug=False)
+        self.assertNotEqual(move, chess.Move.from_uci("d1a4"))
+        self.assertIn(move, board.legal_moves)
+        self.assertEqual(movegeneration.debug_info["score"], 0)
+        # positions after captures were looked up in the search
+        self.assertGreater(movegeneration.debug_info["tb_hits"], 0)
+
+    def test_probe_cache(self):
+        """
+        Test a position is only looked up once
+        """
+        stub = StubTablebase({"8/8/8/4k3/8/8/8/KQ6": 2})
+        self.use(stub)
+        board = CompactBoard(chess.Board("8/8/8/4k3/8/8/8/KQ6 w - - 0 1"))
+        self.assertEqual(tablebase.probe_wdl(board), 2)
+        self.assertEqual(tablebase.probe_wdl(board), 2)
+        self.assertEqual(stub.probes, 1)
+
+        # no table: remembered as such
+        board = CompactBoard()
+        self.assertIsNone(tablebase.probe_wdl(board))
+        self.assertIsNone(tablebase.probe_wdl(board))
+        self.assertEqual(stub.probes, 2)
+
+    def test_wdl_score(self):
+        self.assertEqual(tablebase.wdl_score(2, 3), tablebase.TB_WIN_SCORE - 3)
+        self.assertEqual(tablebase.wdl_score(-2, 3), -tablebase.TB_WIN_SCORE + 3)
+        # cursed wins and blessed losses are draws under the fifty-move rule
+        self.assertEqual(tablebase.wdl_score(1, 3), 0)
+        self.assertEqual(tablebase.wdl_score(-1, 3), 0)
+
+    def test_uci_options(self):
+        with patch("sys.stdout", new=StringIO()) as patched_output:
+            command(0, chess.Board(), "uci")
+            command(0, chess.Board(), "setoption name SyzygyPath value /no/such/directory")
+        self.assertIn("option name SyzygyPath type string", patched_output.getvalue())
+        self.assertIn("info string cannot open tablebases", patched_output.getvalue())
+        self.assertEqual(tablebase.piece_limit(), 0)
+
+        command(0, chess.Board(), "setoption name SyzygyProbeLimit value 5")
+        self.assertEqual(tablebase.syzygy_options["SyzygyProbeLimit"], 5)
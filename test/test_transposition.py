@@ -0,0 +1,56 @@
+import chess
+import unittest
+from compactboard import CompactBoard
+from transposition import (
+    TranspositionTable,
+    EXACT,
+    LOWERBOUND,
+    UPPERBOUND,
+)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_transposed_positions_share_a_key(self):
+        """
+        Test the same position reached via different move orders has the same key
+        """
+        a = chess.Board()
+        for move in ["g1f3", "g8f6", "b1c3"]:
+            a.push_uci(move)
+        b = chess.Board()
+        for move in ["b1c3", "g8f6", "g1f3"]:
+            b.push_uci(move)
+        self.assertEqual(CompactBoard.from_board(a).zobrist_key(), CompactBoard.from_board(b).zobrist_key())
+        self.assertNotEqual(CompactBoard.from_board(a).zobrist_key(), CompactBoard().zobrist_key())
+
+    def test_store_and_probe(self):
+        tt = TranspositionTable(1)
+        move = CompactBoard().parse_uci("e2e4")
+        tt.store(42, 3, 35, EXACT, move)
+
+        entry = tt.probe(42)
+        self.assertIsNotNone(entry)
+        if entry:
+            self.assertEqual(
+                (entry.depth, entry.score, entry.flag, entry.move), (3, 35, EXACT, move)
+            )
+        # a different position in the same slot is a miss
+        self.assertIsNone(tt.probe(42 + tt.size))
+
+        tt.clear()
+        self.assertIsNone(tt.probe(42))
+
+    def test_replacement_policy(self):
+        tt = TranspositionTable(1)
+        tt.store(1, 5, 10, LOWERBOUND, None)
+
+        # a shallower search of another position doesn't evict a deeper one
+        tt.store(1 + tt.size, 2, 20, EXACT, None)
+        self.assertIsNotNone(tt.probe(1))
+        self.assertIsNone(tt.probe(1 + tt.size))
+
+        # unless the deeper entry is left over from a previous search
+        tt.new_search()
+        tt.store(1 + tt.size, 2, 20, UPPERBOUND, None)
+        self.assertIsNone(tt.probe(1))
+        self.assertIsNotNone(tt.probe(1 + tt.size))
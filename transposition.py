@@ -0,0 +1,89 @@
+from typing import List, NamedTuple, Optional
+
+# A bounded transposition table keyed on the polyglot Zobrist hash of a position.
+# https://www.chessprogramming.org/Transposition_Table
+
+# Bound types for stored scores
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+
+# Rough in-memory footprint of one entry (the tuple, its boxed key and score).
+# Used to turn a size in MB into a number of slots.
+ENTRY_SIZE = 160
+
+DEFAULT_SIZE_MB = 16
+
+
+class TTEntry(NamedTuple):
+    key: int
+    depth: int
+    score: int
+    flag: int
+    move: Optional[int]
+    generation: int
+
+
+class TranspositionTable:
+    """
+    Fixed number of slots, indexed by `key % size`.
+    Replacement policy: an entry is overwritten when it belongs to the same position,
+    was stored during an earlier search, or was searched to an equal or lower depth.
+    """
+
+    def __init__(self, size_mb: int = DEFAULT_SIZE_MB):
+        self.generation = 0
+        self.resize(size_mb)
+
+    def resize(self, size_mb: int):
+        self.size_mb = size_mb
+        self.size = max(1, size_mb * 1024 * 1024 // ENTRY_SIZE)
+        self.clear()
+
+    def clear(self) -> None:
+        self.table: List[Optional[TTEntry]] = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Entries from previous searches are kept, but become first in line for replacement.
+        """
+        self.generation += 1
+
+    def hashfull(self) -> int:
+        """
+        How full the table is with entries from the current search, in permille,
+        estimated from its first 1000 slots.
+        """
+        sample = self.table[:1000]
+        used = sum(
+            1 for entry in sample if entry is not None and entry.generation == self.generation
+        )
+        return used * 1000 // len(sample)
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        entry = self.table[key % self.size]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(
+        self,
+        key: int,
+        depth: int,
+        score: int,
+        flag: int,
+        move: Optional[int],
+    ):
+        index = key % self.size
+        entry = self.table[index]
+        if (
+            entry is None
+            or entry.key == key
+            or entry.generation != self.generation
+            or depth >= entry.depth
+        ):
+            # Don't lose a known best move when re-storing a position without one
+            if move is None and entry is not None and entry.key == key:
+                move = entry.move
+            self.table[index] = TTEntry(key, depth, score, flag, move, self.generation)